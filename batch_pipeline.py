@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量处理流水线
+把每个任务拆成 读取 → 计算 → 写出 三段：读取线程预先解码后面的任务，
+计算在调用线程中进行，写出线程异步编码保存，读写网络共享盘上的素材时
+CPU不必等待IO
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StagedPipeline:
+    """
+    读取/计算/写出三段流水线
+
+    各段线程数和队列长度分别设置。已读取未计算的任务不超过prefetch个，
+    已计算未写完的任务不超过write_queue个，队列满时上一段等待（背压），
+    因此同时在内存中的图片数量有上限。结果按输入顺序产出。
+    """
+
+    def __init__(self, read, compute, write, read_threads=2, prefetch=4,
+                 write_threads=2, write_queue=4):
+        """
+        Args:
+            read (callable): read(item) -> data，在读取线程中执行
+            compute (callable): compute(item, data) -> output，在调用线程中执行
+            write (callable): write(item, output) -> result，在写出线程中执行
+            read_threads (int): 读取线程数
+            prefetch (int): 预读任务数上限，0为不使用线程、在调用线程中逐个顺序处理
+            write_threads (int): 写出线程数
+            write_queue (int): 等待写出的任务数上限
+        """
+        self.read = read
+        self.compute = compute
+        self.write = write
+        self.read_threads = max(1, read_threads)
+        self.prefetch = max(0, prefetch)
+        self.write_threads = max(1, write_threads)
+        self.write_queue = max(1, write_queue)
+
+    def run(self, items):
+        """
+        依次处理items
+
+        Yields:
+            tuple: (任务, 写出结果, 异常)，任一段出错时结果为None、异常为该错误
+        """
+        if self.prefetch == 0:
+            yield from self._run_inline(items)
+            return
+
+        items = iter(items)
+        reads = deque()
+        writes = deque()
+        readers = ThreadPoolExecutor(max_workers=self.read_threads)
+        writers = ThreadPoolExecutor(max_workers=self.write_threads)
+
+        def fill_reads():
+            while len(reads) < self.prefetch:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                reads.append((item, readers.submit(self.read, item)))
+
+        try:
+            fill_reads()
+            while reads:
+                item, future = reads.popleft()
+                # 计算当前任务的同时继续预读
+                fill_reads()
+                try:
+                    output = self.compute(item, future.result())
+                    writes.append((item, writers.submit(self.write, item, output), None))
+                except Exception as e:
+                    writes.append((item, None, e))
+
+                # 写出队列已满时等待最早的任务写完；已经写完的任务随时产出
+                while writes and (len(writes) > self.write_queue or self._done(writes[0])):
+                    yield self._finish(writes.popleft())
+
+            while writes:
+                yield self._finish(writes.popleft())
+        finally:
+            for _, future in reads:
+                future.cancel()
+            readers.shutdown(wait=True)
+            writers.shutdown(wait=True)
+
+    def _run_inline(self, items):
+        for item in items:
+            try:
+                result = self.write(item, self.compute(item, self.read(item)))
+            except Exception as e:
+                yield item, None, e
+                continue
+            yield item, result, None
+
+    @staticmethod
+    def _done(entry):
+        future = entry[1]
+        return future is None or future.done()
+
+    @staticmethod
+    def _finish(entry):
+        item, future, error = entry
+        if future is None:
+            return item, None, error
+        try:
+            return item, future.result(), None
+        except Exception as e:
+            return item, None, e
@@ -60,6 +60,11 @@ def example_usage():
             quality=1  # 高质量
         )
         
+        # 5. 内存中逐帧处理 - 不写PNG，直接拿到图像数组
+        print("\n=== 示例4: 内存中逐帧处理 ===")
+        for index, timestamp, frame in converter.iter_frames(video_path, frame_rate=1.0, end_time=10):
+            print(f"第{index}帧 ({timestamp:.3f}s): {frame.shape[1]}x{frame.shape[0]}")
+        
         print("\n=== 所有示例完成 ===")
         print("生成的图片保存在以下目录:")
         print("- example_output_all_frames/")
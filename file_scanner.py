@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录扫描
+单次os.scandir遍历目录，按扩展名（不区分大小写）和包含/排除模式筛选文件，
+边扫描边产出，批量处理不必等整个目录树扫描完
+"""
+
+import fnmatch
+import glob
+import os
+from pathlib import Path
+
+
+# 各工具支持的图片扩展名
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp')
+
+
+def scan_files(root, extensions=None, recursive=False, include=None, exclude=None):
+    """
+    扫描目录中的文件
+
+    Args:
+        root (str): 要扫描的目录
+        extensions (list): 允许的扩展名（含点，不区分大小写），None为不限
+        recursive (bool): 是否扫描子目录
+        include (list): 通配模式，文件名或相对路径匹配其中之一的文件才保留，None为不限
+        exclude (list): 通配模式，文件名或相对路径匹配其中之一的文件和子目录被跳过
+            （两者中以'/'开头的模式只匹配相对root的路径，如'/build'只排除root下的build目录）
+
+    Returns:
+        iterator: 逐个产出文件的Path，顺序为目录遍历顺序
+
+    Raises:
+        FileNotFoundError: 目录不存在
+    """
+    if not os.path.isdir(root):
+        raise FileNotFoundError(f"输入目录不存在: {root}")
+    if extensions is not None:
+        extensions = {ext.lower() for ext in extensions}
+    return _scan(root, extensions, recursive, list(include or []), list(exclude or []))
+
+
+def count_files(root, extensions=None, recursive=False, include=None, exclude=None):
+    """
+    统计scan_files会产出的文件数量
+    """
+    return sum(1 for _ in scan_files(root, extensions, recursive, include, exclude))
+
+
+def output_dir_for(path, root, output_root):
+    """
+    root下某个文件对应的输出目录：保持它相对root的子目录结构
+    """
+    rel_dir = os.path.relpath(os.path.dirname(os.path.abspath(path)), os.path.abspath(root))
+    return output_root if rel_dir == os.curdir else os.path.join(output_root, rel_dir)
+
+
+def exclude_output_dir(root, output_root, exclude=None):
+    """
+    输出目录位于root之内时，把它加入排除模式，递归扫描时不会处理刚写出的结果
+    """
+    patterns = list(exclude or [])
+    rel_path = os.path.relpath(os.path.abspath(output_root), os.path.abspath(root))
+    if rel_path != os.curdir and not rel_path.startswith(os.pardir):
+        patterns.append('/' + glob.escape(rel_path.replace(os.sep, '/')))
+    return patterns
+
+
+def _scan(root, extensions, recursive, include, exclude):
+    # 深度优先，栈中为 (目录路径, 相对root的路径前缀)
+    stack = [(root, '')]
+    while stack:
+        dir_path, prefix = stack.pop()
+        try:
+            entries = os.scandir(dir_path)
+        except OSError as e:
+            if dir_path == root:
+                raise
+            print(f"警告: 无法读取目录 {dir_path}: {e}")
+            continue
+
+        subdirs = []
+        with entries:
+            for entry in entries:
+                name = entry.name
+                rel_path = prefix + name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and not _matches(name, rel_path, exclude):
+                            subdirs.append((entry.path, rel_path + '/'))
+                        continue
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+
+                if extensions is not None and os.path.splitext(name)[1].lower() not in extensions:
+                    continue
+                if include and not _matches(name, rel_path, include):
+                    continue
+                if exclude and _matches(name, rel_path, exclude):
+                    continue
+                yield Path(entry.path)
+
+        # 先扫描完当前目录再进入子目录，子目录按名称顺序处理
+        stack.extend(reversed(sorted(subdirs)))
+
+
+def _matches(name, rel_path, patterns):
+    for pattern in patterns:
+        if pattern.startswith('/'):
+            if fnmatch.fnmatch(rel_path, pattern[1:]):
+                return True
+        elif fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(rel_path, pattern):
+            return True
+    return False
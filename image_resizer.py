@@ -6,15 +6,24 @@
 """
 
 import os
+import itertools
 import cv2
 from pathlib import Path
 from PIL import Image
 import numpy as np
+from result_cache import ResultCache, resolve_result_cache
+from batch_pipeline import StagedPipeline
+from file_scanner import IMAGE_EXTENSIONS, scan_files, output_dir_for, exclude_output_dir
 
 
 class ImageResizer:
+    # 批量处理流水线：读取线程预读解码，写出线程异步编码保存
+    PIPELINE_READ_THREADS = 2
+    PIPELINE_PREFETCH = 4             # 预读的图片数
+    PIPELINE_WRITE_THREADS = 2
+
     def __init__(self):
-        self.supported_formats = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
+        self.supported_formats = list(IMAGE_EXTENSIONS)
 
     def resize_image(self, input_path, output_path, width=None, height=None,
                     keep_aspect_ratio=True, quality=95, method='LANCZOS'):
@@ -47,39 +56,9 @@ class ImageResizer:
             if output_dir:
                 os.makedirs(output_dir, exist_ok=True)
 
-            # 使用PIL处理图片
-            with Image.open(input_path) as img:
-                original_width, original_height = img.size
-
-                # 计算目标尺寸
-                target_width, target_height = self._calculate_target_size(
-                    original_width, original_height, width, height, keep_aspect_ratio
-                )
-
-                # 选择缩放算法
-                resample_method = getattr(Image.Resampling, method, Image.Resampling.LANCZOS)
-
-                # 调整大小
-                resized_img = img.resize((target_width, target_height), resample_method)
-
-                # 保存图片
-                save_kwargs = {}
-                output_ext = Path(output_path).suffix.lower()
-
-                if output_ext in ['.jpg', '.jpeg']:
-                    save_kwargs['quality'] = quality
-                    save_kwargs['optimize'] = True
-                    # 如果原图有透明通道，转换为RGB
-                    if resized_img.mode in ('RGBA', 'LA', 'P'):
-                        background = Image.new('RGB', resized_img.size, (255, 255, 255))
-                        if resized_img.mode == 'P':
-                            resized_img = resized_img.convert('RGBA')
-                        background.paste(resized_img, mask=resized_img.split()[-1] if resized_img.mode == 'RGBA' else None)
-                        resized_img = background
-                elif output_ext == '.png':
-                    save_kwargs['optimize'] = True
-
-                resized_img.save(output_path, **save_kwargs)
+            img = self._load_image(input_path)
+            resized_img = self._resize_loaded(img, width, height, keep_aspect_ratio, method)
+            self._save_image(resized_img, output_path, quality)
 
             return True
 
@@ -87,6 +66,51 @@ class ImageResizer:
             print(f"调整图片大小失败 {input_path}: {e}")
             return False
 
+    def _load_image(self, input_path):
+        """读取并解码图片（解码完成后文件即关闭）"""
+        img = Image.open(input_path)
+        try:
+            img.load()
+        except Exception:
+            img.close()
+            raise
+        return img
+
+    def _resize_loaded(self, img, width=None, height=None, keep_aspect_ratio=True, method='LANCZOS'):
+        """调整已解码图片的大小"""
+        original_width, original_height = img.size
+
+        # 计算目标尺寸
+        target_width, target_height = self._calculate_target_size(
+            original_width, original_height, width, height, keep_aspect_ratio
+        )
+
+        # 选择缩放算法
+        resample_method = getattr(Image.Resampling, method, Image.Resampling.LANCZOS)
+
+        # 调整大小
+        return img.resize((target_width, target_height), resample_method)
+
+    def _save_image(self, resized_img, output_path, quality=95):
+        """按输出格式编码保存"""
+        save_kwargs = {}
+        output_ext = Path(output_path).suffix.lower()
+
+        if output_ext in ['.jpg', '.jpeg']:
+            save_kwargs['quality'] = quality
+            save_kwargs['optimize'] = True
+            # 如果原图有透明通道，转换为RGB
+            if resized_img.mode in ('RGBA', 'LA', 'P'):
+                background = Image.new('RGB', resized_img.size, (255, 255, 255))
+                if resized_img.mode == 'P':
+                    resized_img = resized_img.convert('RGBA')
+                background.paste(resized_img, mask=resized_img.split()[-1] if resized_img.mode == 'RGBA' else None)
+                resized_img = background
+        elif output_ext == '.png':
+            save_kwargs['optimize'] = True
+
+        resized_img.save(output_path, **save_kwargs)
+
     def _calculate_target_size(self, orig_width, orig_height, target_width, target_height, keep_aspect_ratio):
         """计算目标尺寸"""
         if not target_width and not target_height:
@@ -113,7 +137,8 @@ class ImageResizer:
 
     def batch_resize(self, input_dir, output_dir, width=None, height=None,
                     keep_aspect_ratio=True, quality=95, method='LANCZOS',
-                    output_format=None):
+                    output_format=None, cache=False, prefetch=None, write_threads=None,
+                    read_threads=None, recursive=False, include=None, exclude=None):
         """
         批量调整图片大小
 
@@ -126,57 +151,115 @@ class ImageResizer:
             quality (int): JPEG质量
             method (str): 缩放算法
             output_format (str): 输出格式 ('jpg', 'png', None=保持原格式)
+            cache (bool|ResultCache): 是否使用结果缓存，输入内容和参数都相同时直接复用上次的结果
+            prefetch (int): 预读解码的图片数，0为不预读、读写与缩放顺序进行，
+                None使用PIPELINE_PREFETCH
+            write_threads (int): 异步编码保存的线程数，None使用PIPELINE_WRITE_THREADS
+            read_threads (int): 预读解码的线程数，None使用PIPELINE_READ_THREADS
+            recursive (bool): 是否处理子目录中的图片，结果按相同的子目录结构保存
+            include (list): 通配模式，只处理文件名或相对路径匹配其中之一的图片
+            exclude (list): 通配模式，跳过文件名或相对路径匹配其中之一的图片和子目录
 
         Returns:
             int: 成功处理的图片数量
         """
-        if not os.path.exists(input_dir):
-            raise FileNotFoundError(f"输入目录不存在: {input_dir}")
-
-        # 获取所有支持的图片文件
-        image_files = []
-        for ext in self.supported_formats:
-            pattern = f"*{ext}"
-            image_files.extend(Path(input_dir).glob(pattern))
-            pattern = f"*{ext.upper()}"
-            image_files.extend(Path(input_dir).glob(pattern))
-
-        if not image_files:
+        # 边扫描边处理；输出目录在输入目录内时递归扫描跳过它
+        image_files = scan_files(input_dir, self.supported_formats, recursive, include,
+                                 exclude_output_dir(input_dir, output_dir, exclude))
+        first = next(image_files, None)
+        if first is None:
             print("未找到支持的图片文件")
             return 0
+        image_files = itertools.chain([first], image_files)
 
         # 创建输出目录
         os.makedirs(output_dir, exist_ok=True)
 
         success_count = 0
-        total_count = len(image_files)
-
-        print(f"开始批量调整 {total_count} 张图片大小...")
-
-        for i, image_file in enumerate(image_files, 1):
-            try:
-                # 生成输出文件名
-                if output_format:
-                    output_filename = f"{image_file.stem}.{output_format}"
-                else:
-                    output_filename = image_file.name
-
-                output_path = os.path.join(output_dir, output_filename)
-
-                # 调整图片大小
-                if self.resize_image(
-                    str(image_file), output_path, width, height,
-                    keep_aspect_ratio, quality, method
-                ):
-                    success_count += 1
-                    print(f"[{i}/{total_count}] ✓ {image_file.name}")
-                else:
-                    print(f"[{i}/{total_count}] ✗ {image_file.name} - 处理失败")
-
-            except Exception as e:
-                print(f"[{i}/{total_count}] ✗ {image_file.name} - 错误: {e}")
+        total_count = 0
+
+        print("开始批量调整图片大小...")
+
+        result_cache = resolve_result_cache(cache)
+        cached_count = 0
+
+        def iter_jobs():
+            nonlocal total_count, success_count, cached_count
+            created_dirs = set()
+            for i, image_file in enumerate(image_files, 1):
+                total_count = i
+                try:
+                    # 生成输出文件名
+                    if output_format:
+                        output_filename = f"{image_file.stem}.{output_format}"
+                    else:
+                        output_filename = image_file.name
+
+                    target_dir = output_dir_for(image_file, input_dir, output_dir)
+                    if target_dir not in created_dirs:
+                        os.makedirs(target_dir, exist_ok=True)
+                        created_dirs.add(target_dir)
+                    output_path = os.path.join(target_dir, output_filename)
+
+                    # 输出格式也影响结果，一并计入缓存键
+                    cache_key = None
+                    if result_cache is not None:
+                        cache_key = result_cache.make_key(str(image_file), 'resize', {
+                            'width': width,
+                            'height': height,
+                            'keep_aspect_ratio': keep_aspect_ratio,
+                            'quality': quality,
+                            'method': method,
+                            'output_ext': Path(output_filename).suffix.lower(),
+                        })
+                        if result_cache.fetch(cache_key, output_path):
+                            success_count += 1
+                            cached_count += 1
+                            print(f"[{i}] ✓ {image_file.name} (缓存)")
+                            continue
+
+                except Exception as e:
+                    print(f"[{i}] ✗ {image_file.name} - 错误: {e}")
+                    continue
+
+                yield i, image_file, output_path, cache_key
+
+        if prefetch is None:
+            prefetch = self.PIPELINE_PREFETCH
+        if write_threads is None:
+            write_threads = self.PIPELINE_WRITE_THREADS
+        if read_threads is None:
+            read_threads = self.PIPELINE_READ_THREADS
+
+        # 读取线程预读解码后面的图片，写出线程异步编码保存，缩放在当前线程进行
+        pipeline = StagedPipeline(
+            read=lambda job: self._load_image(str(job[1])),
+            compute=lambda job, img: self._resize_loaded(img, width, height, keep_aspect_ratio, method),
+            write=lambda job, resized_img: self._save_image(resized_img, job[2], quality),
+            read_threads=read_threads,
+            prefetch=prefetch,
+            write_threads=write_threads,
+            write_queue=max(1, write_threads * 2),
+        )
+        for (i, image_file, output_path, cache_key), _, error in pipeline.run(iter_jobs()):
+            if error is not None:
+                print(f"[{i}] ✗ {image_file.name} - 错误: {error}")
+                continue
+
+            success_count += 1
+            print(f"[{i}] ✓ {image_file.name}")
+            if cache_key:
+                try:
+                    result_cache.store(cache_key, output_path)
+                except OSError as e:
+                    print(f"警告: 无法写入结果缓存: {e}")
+
+        if result_cache is not None:
+            result_cache.save_index()
 
         print(f"\n批量调整完成！成功处理 {success_count}/{total_count} 张图片")
+        if cached_count:
+            print(f"其中 {cached_count} 张直接使用了缓存结果")
         return success_count
 
     def get_image_info(self, image_path):
@@ -234,6 +317,18 @@ def main():
                        default='LANCZOS', help='缩放算法')
     parser.add_argument('--format', choices=['jpg', 'png'], help='输出格式')
     parser.add_argument('--batch', action='store_true', help='批量处理')
+    parser.add_argument('--cache', action='store_true',
+                       help='批量处理时使用结果缓存，输入内容和参数都未变的图片直接复用上次结果')
+    parser.add_argument('--cache-size', type=int, default=2048, help='结果缓存大小上限(MB) (默认: 2048)')
+    parser.add_argument('-r', '--recursive', action='store_true', help='批量处理时包含子目录中的图片')
+    parser.add_argument('--include', action='append',
+                       help='批量处理时只处理匹配该通配模式的文件 (匹配文件名或相对路径, 可多次指定)')
+    parser.add_argument('--exclude', action='append',
+                       help='批量处理时跳过匹配该通配模式的文件和子目录 (可多次指定)')
+    parser.add_argument('--prefetch', type=int,
+                       help='批量处理时预读解码的图片数, 0为关闭流水线 (默认: 4)')
+    parser.add_argument('--write-threads', type=int, help='批量处理时异步编码保存的线程数 (默认: 2)')
+    parser.add_argument('--read-threads', type=int, help='批量处理时预读解码的线程数 (默认: 2)')
 
     args = parser.parse_args()
 
@@ -245,7 +340,14 @@ def main():
             output_dir = args.output or f"{args.input}_resized"
             success_count = resizer.batch_resize(
                 args.input, output_dir, args.width, args.height,
-                not args.no_aspect, args.quality, args.method, args.format
+                not args.no_aspect, args.quality, args.method, args.format,
+                cache=ResultCache(max_bytes=args.cache_size * 1024 * 1024) if args.cache else False,
+                prefetch=args.prefetch,
+                write_threads=args.write_threads,
+                read_threads=args.read_threads,
+                recursive=args.recursive,
+                include=args.include,
+                exclude=args.exclude
             )
             print(f"成功处理 {success_count} 张图片")
         else:
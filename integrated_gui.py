@@ -20,8 +20,9 @@ import time
 
 # 导入工具类
 from video_to_png import VideoToPNG
-from remove_background import BackgroundRemover
+from remove_background import BackgroundRemover, REMBG_MODELS
 from image_resizer import ImageResizer
+from file_scanner import count_files, IMAGE_EXTENSIONS
 
 
 class WorkerThread(QThread):
@@ -147,6 +148,14 @@ class IntegratedGUI(QMainWindow):
         self.quality_spin.setValue(3)
         param_layout.addWidget(self.quality_spin, 1, 3)
 
+        # 编码线程
+        param_layout.addWidget(QLabel("编码线程:"), 2, 0)
+        self.encode_threads_spin = QSpinBox()
+        self.encode_threads_spin.setRange(0, 32)
+        self.encode_threads_spin.setValue(0)
+        self.encode_threads_spin.setSpecialValueText("自动")
+        param_layout.addWidget(self.encode_threads_spin, 2, 1)
+
         layout.addWidget(param_group)
 
         # 操作按钮
@@ -229,13 +238,20 @@ class IntegratedGUI(QMainWindow):
         algorithms = [
             ("rembg", "AI智能识别，效果最佳 - 适用于通用场景、复杂背景"),
             ("grabcut", "交互式分割，可调参数 - 适用于主体明确的图片"),
+            ("grabcut_fast", "金字塔GrabCut，由粗到细 - 适用于大尺寸的主体明确图片"),
             ("watershed", "基于梯度的分割 - 适用于边界清晰的图片"),
             ("kmeans", "颜色聚类分割 - 适用于颜色差异明显的图片"),
-            ("threshold", "简单阈值分割，速度最快 - 适用于纯色背景")
+            ("threshold", "简单阈值分割，速度最快 - 适用于纯色背景"),
+            ("chromakey", "色度抠像，软边+去溢色 - 适用于绿幕/蓝幕拍摄"),
+            ("auto", "自动选择，先快速分析每张图片 - 纯色背景用阈值，复杂背景才用AI")
         ]
 
         for algo_name, description in algorithms:
             self.method_combo.addItem(f"{algo_name} - {description}", algo_name)
+            if algo_name == "rembg":
+                # rembg的其他可选模型，数据格式为 "rembg:模型名"
+                for model_name, model_desc in REMBG_MODELS[1:]:
+                    self.method_combo.addItem(f"rembg ({model_name}) - {model_desc}", f"rembg:{model_name}")
 
         method_layout.addWidget(self.method_combo, 0, 1, 1, 2)
 
@@ -487,14 +503,7 @@ class IntegratedGUI(QMainWindow):
     def count_images_in_directory(self, dir_path):
         """统计目录中的图片文件数量"""
         try:
-            from pathlib import Path
-            supported_formats = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
-            count = 0
-            dir_obj = Path(dir_path)
-            for ext in supported_formats:
-                count += len(list(dir_obj.glob(f'*{ext}')))
-                count += len(list(dir_obj.glob(f'*{ext.upper()}')))
-            return count
+            return count_files(dir_path, IMAGE_EXTENSIONS)
         except Exception:
             return 0
 
@@ -565,6 +574,7 @@ class IntegratedGUI(QMainWindow):
         start_time = self.start_spin.value()
         end_time = self.end_spin.value() if self.end_spin.value() > 0 else None
         quality = self.quality_spin.value()
+        encode_threads = self.encode_threads_spin.value() or None
 
         # 禁用按钮
         self.video_convert_btn.setEnabled(False)
@@ -574,7 +584,8 @@ class IntegratedGUI(QMainWindow):
         # 创建工作线程
         def convert_func():
             return self.video_converter.convert(
-                video_path, output_dir, fps, start_time, end_time, quality
+                video_path, output_dir, fps, start_time, end_time, quality,
+                encode_threads=encode_threads
             )
 
         self.worker = WorkerThread(convert_func)
@@ -612,6 +623,8 @@ class IntegratedGUI(QMainWindow):
         output_path = self.bg_output_line.text()
         # 获取选中算法的实际名称，而不是显示文本
         method = self.method_combo.currentData() or self.method_combo.currentText().split(' - ')[0]
+        method, _, model = method.partition(':')
+        model = model or None
 
         if not input_path:
             QMessageBox.warning(self, "警告", "请先选择输入文件或目录！")
@@ -644,10 +657,10 @@ class IntegratedGUI(QMainWindow):
         def process_func():
             if is_batch:
                 # 批量处理：输入目录，输出目录
-                return self.bg_remover.batch_process(input_path, output_path, method=method)
+                return self.bg_remover.batch_process(input_path, output_path, method=method, model=model)
             else:
                 # 单文件处理：输入文件，输出文件
-                return self.bg_remover.process_image(input_path, output_path, method=method)
+                return self.bg_remover.process_image(input_path, output_path, method=method, model=model)
 
         self.bg_worker = WorkerThread(process_func)
         self.bg_worker.finished.connect(self.on_bg_finished)
@@ -10,59 +10,578 @@ import numpy as np
 from PIL import Image, ImageFilter
 import os
 import argparse
+import re
 from pathlib import Path
 import sys
+import struct
+import time
+import zlib
+import threading
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from result_cache import ResultCache, resolve_result_cache
+from batch_pipeline import StagedPipeline
+from file_scanner import IMAGE_EXTENSIONS, scan_files, output_dir_for, exclude_output_dir
 # 注意：如果需要使用更高级的分割算法，可以添加以下导入：
 # from skimage import segmentation, color
 # import matplotlib.pyplot as plt
 
-try:
-    from rembg import remove, new_session
-    REMBG_AVAILABLE = True
-except ImportError:
-    REMBG_AVAILABLE = False
-    print("警告: rembg库未安装，AI背景去除功能将不可用")
+# rembg各模型的预处理参数 (mean, std, 输入尺寸)，与rembg内部normalize保持一致
+REMBG_MODEL_PARAMS = {
+    'u2net': ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    'u2netp': ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    'u2net_human_seg': ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    'u2net_custom': ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    'silueta': ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    'isnet-general-use': ((0.485, 0.456, 0.406), (1.0, 1.0, 1.0), (1024, 1024)),
+    'isnet-anime': ((0.485, 0.456, 0.406), (1.0, 1.0, 1.0), (1024, 1024)),
+}
+
+# 可选的rembg模型及说明（u2net_custom通过--model指定.onnx文件使用）
+REMBG_MODELS = [
+    ('u2net', '默认模型，效果最好，约170MB'),
+    ('u2netp', '轻量版u2net，约4MB，CPU上速度快数倍'),
+    ('silueta', '压缩版u2net，约43MB，效果接近u2net'),
+    ('isnet-general-use', '高分辨率通用模型，边缘更细但更慢'),
+    ('isnet-anime', '针对动漫/二次元角色的高分辨率模型'),
+    ('u2net_human_seg', '人像专用模型'),
+]
+
+
+# 视频转PNG输出的帧序列文件名：frame_帧序号_时间s.png
+FRAME_NAME_PATTERN = re.compile(r'^frame_(\d+)_')
+
+
+def guided_upsample_mask(mask, guide, radius=2, eps=1e-3):
+    """
+    以原图为引导把低分辨率掩码上采样到原图尺寸（快速引导滤波）
+    
+    引导滤波的线性系数在低分辨率上求出，双线性放大后再作用于全分辨率
+    灰度图，边缘贴合原图细节，计算量主要在低分辨率上。
+    
+    Args:
+        mask (numpy.ndarray): 低分辨率uint8掩码
+        guide (numpy.ndarray): 全分辨率BGR原图
+        radius (int): 低分辨率上的滤波窗口半径
+        eps (float): 正则项，越小越贴合引导图边缘
+        
+    Returns:
+        numpy.ndarray: 与原图同尺寸的uint8掩码
+    """
+    height, width = guide.shape[:2]
+    small_size = (mask.shape[1], mask.shape[0])
+    ksize = (2 * radius + 1, 2 * radius + 1)
+    
+    guide_full = cv2.cvtColor(guide, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    guide_full *= 1.0 / 255
+    guide_small = cv2.resize(guide_full, small_size, interpolation=cv2.INTER_AREA)
+    p = mask.astype(np.float32) * (1.0 / 255)
+    
+    mean_i = cv2.boxFilter(guide_small, -1, ksize)
+    mean_p = cv2.boxFilter(p, -1, ksize)
+    cov_ip = cv2.boxFilter(guide_small * p, -1, ksize) - mean_i * mean_p
+    var_i = cv2.boxFilter(guide_small * guide_small, -1, ksize) - mean_i * mean_i
+    
+    a = cov_ip / (var_i + eps)
+    b = mean_p - a * mean_i
+    a = cv2.resize(cv2.boxFilter(a, -1, ksize), (width, height), interpolation=cv2.INTER_LINEAR)
+    b = cv2.resize(cv2.boxFilter(b, -1, ksize), (width, height), interpolation=cv2.INTER_LINEAR)
+    
+    guide_full *= a
+    guide_full += b
+    guide_full *= 255
+    return np.clip(guide_full, 0, 255).astype(np.uint8)
+
+
+def otsu_threshold_from_hist(hist):
+    """
+    由256级灰度直方图计算Otsu阈值，与cv2.threshold的THRESH_OTSU结果一致
+    
+    分块处理时先逐块累加直方图，再用它求整图阈值。
+    """
+    hist = np.asarray(hist, dtype=np.float64).ravel()
+    total = hist.sum()
+    if total == 0:
+        return 0
+    p = hist / total
+    mu = float(np.dot(np.arange(256), p))
+    eps = np.finfo(np.float32).eps
+    
+    mu1 = q1 = 0.0
+    max_sigma = 0.0
+    max_value = 0
+    for i in range(256):
+        p_i = p[i]
+        mu1 *= q1
+        q1 += p_i
+        q2 = 1.0 - q1
+        if min(q1, q2) < eps or max(q1, q2) > 1.0 - eps:
+            continue
+        mu1 = (mu1 + i * p_i) / q1
+        mu2 = (mu - q1 * mu1) / q2
+        sigma = q1 * q2 * (mu1 - mu2) * (mu1 - mu2)
+        if sigma > max_sigma:
+            max_sigma = sigma
+            max_value = i
+    return max_value
+
+
+class StripPNGWriter:
+    """
+    按行条带增量写出PNG，整张输出图不需要同时放在内存里
+    
+    每行使用Up滤波（与上一行逐字节相减），压缩流式进行。
+    """
+    
+    def __init__(self, path, width, height, channels=4, compression=3):
+        """
+        Args:
+            path (str): 输出路径
+            width (int): 图像宽度
+            height (int): 图像高度
+            channels (int): 通道数，1=灰度，3=BGR，4=BGRA
+            compression (int): zlib压缩级别 0-9
+        """
+        color_types = {1: 0, 3: 2, 4: 6}
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.rows_written = 0
+        self._previous_row = np.zeros(width * channels, np.uint8)
+        self._compressor = zlib.compressobj(compression)
+        self._file = open(path, 'wb')
+        self._file.write(b'\x89PNG\r\n\x1a\n')
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8,
+                                                color_types[channels], 0, 0, 0))
+    
+    def write(self, rows):
+        """
+        写入若干行（BGR/BGRA顺序，与OpenCV一致）
+        """
+        if self.channels == 3:
+            rows = cv2.cvtColor(rows, cv2.COLOR_BGR2RGB)
+        elif self.channels == 4:
+            rows = cv2.cvtColor(rows, cv2.COLOR_BGRA2RGBA)
+        rows = rows.reshape(len(rows), -1)
+        
+        filtered = np.empty((len(rows), rows.shape[1] + 1), np.uint8)
+        filtered[:, 0] = 2  # Up滤波
+        filtered[0, 1:] = rows[0] - self._previous_row
+        filtered[1:, 1:] = rows[1:] - rows[:-1]
+        self._previous_row = rows[-1].copy()
+        self.rows_written += len(rows)
+        
+        data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._write_chunk(b'IDAT', data)
+    
+    def close(self):
+        """
+        结束压缩流并写入文件尾
+        """
+        if self._file is None:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"PNG行数不完整: {self.rows_written}/{self.height}")
+            self._write_chunk(b'IDAT', self._compressor.flush())
+            self._write_chunk(b'IEND', b'')
+        finally:
+            self._file.close()
+            self._file = None
+    
+    def _write_chunk(self, chunk_type, data):
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff))
+
+
+class MaskWriter:
+    """
+    各去背景方法共用的合成与保存
+    
+    方法只计算uint8掩码，由这里把掩码写入输出图像的alpha通道并编码保存。
+    保存时使用可复用的BGRA缓冲区，尺寸相同的连续图片不再重新分配。
+    """
+    
+    # rgba: BGR + alpha；mask: 只输出灰度掩码；premultiplied: 颜色预乘alpha
+    OUTPUT_MODES = ('rgba', 'mask', 'premultiplied')
+    
+    def __init__(self, output_mode='rgba', png_compression=None):
+        """
+        Args:
+            output_mode (str): 输出模式，见OUTPUT_MODES
+            png_compression (int): PNG压缩级别 0-9，None使用OpenCV默认值
+        """
+        if output_mode not in self.OUTPUT_MODES:
+            raise ValueError(f"不支持的输出模式: {output_mode}")
+        self.output_mode = output_mode
+        self.png_compression = png_compression
+        self.channels = 1 if output_mode == 'mask' else 4
+        self._params = [] if png_compression is None else [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+        self._buffer = None
+    
+    def compose(self, img, mask, out=None):
+        """
+        按输出模式合成输出图像
+        
+        Args:
+            img (numpy.ndarray): BGR图像
+            mask (numpy.ndarray): 与图像同尺寸的uint8掩码
+            out (numpy.ndarray): 写入结果的BGRA缓冲区，尺寸不符或为None时新分配
+            
+        Returns:
+            numpy.ndarray: 输出图像（mask模式下即掩码本身）
+        """
+        if self.output_mode == 'mask':
+            return mask
+        
+        height, width = mask.shape[:2]
+        if out is None or out.shape != (height, width, 4):
+            out = np.empty((height, width, 4), np.uint8)
+        cv2.mixChannels([img, mask], [out], [0, 0, 1, 1, 2, 2, 3, 3])
+        if self.output_mode == 'premultiplied':
+            cv2.cvtColor(out, cv2.COLOR_RGBA2mRGBA, dst=out)
+        return out
+    
+    def write(self, output_path, img, mask, reuse_buffer=True):
+        """
+        合成并保存到output_path
+        
+        Args:
+            reuse_buffer (bool): 复用上一次的缓冲区。多个线程同时写出时须为False
+        
+        Returns:
+            bool: 是否保存成功
+        """
+        if not reuse_buffer:
+            return cv2.imwrite(output_path, self.compose(img, mask), self._params)
+        result = self.compose(img, mask, self._buffer)
+        if result is not mask:
+            self._buffer = result
+        return cv2.imwrite(output_path, result, self._params)
+    
+    def strip_writer(self, path, width, height):
+        """
+        按当前输出模式创建分条带写出的StripPNGWriter
+        """
+        compression = 3 if self.png_compression is None else self.png_compression
+        return StripPNGWriter(path, width, height, self.channels, compression)
+
+
+# rembg会连带导入onnxruntime等较重的依赖，首次使用AI去背景时才导入
+_rembg = None
+_rembg_checked = False
+
+
+def rembg_available():
+    """
+    按需导入rembg，返回是否可用（只在第一次调用时尝试导入）
+    """
+    global _rembg, _rembg_checked
+    if not _rembg_checked:
+        _rembg_checked = True
+        try:
+            import rembg
+            _rembg = rembg
+        except ImportError:
+            print("警告: rembg库未安装，AI背景去除功能将不可用")
+    return _rembg is not None
+
+
+def resolve_rembg_model(model=None, model_path=None):
+    """
+    把模型参数解析为 (rembg模型名, 自定义模型路径)
+    
+    model可以是rembg模型名，也可以直接是一个.onnx文件路径（例如自行量化的
+    int8模型），此时按u2net_custom加载，输入预处理与u2net相同。
+    """
+    model = model or 'u2net'
+    if model_path or model.lower().endswith('.onnx'):
+        return 'u2net_custom', os.path.abspath(os.path.expanduser(model_path or model))
+    if model not in REMBG_MODEL_PARAMS:
+        raise ValueError(f"不支持的rembg模型: {model}")
+    return model, None
+
+
+def create_rembg_session(model_name='u2net', onnx_threads=None, model_path=None):
+    """
+    创建rembg模型会话
+    
+    Args:
+        model_name (str): rembg模型名称
+        onnx_threads (int): ONNX Runtime算子内线程数，None使用默认值（全部核心）
+        model_path (str): u2net_custom使用的自定义ONNX模型路径
+    """
+    if not rembg_available():
+        raise ValueError("rembg库不可用，请安装: pip install rembg")
+    
+    session_kwargs = {'model_path': model_path} if model_path else {}
+    if not onnx_threads:
+        return _rembg.new_session(model_name, **session_kwargs)
+    
+    # new_session不接受线程设置，这里按同样的方式自行构造会话
+    try:
+        import onnxruntime as ort
+        from rembg.sessions import sessions_class
+    except ImportError:
+        return _rembg.new_session(model_name, **session_kwargs)
+    
+    session_class = next((sc for sc in sessions_class if sc.name() == model_name), None)
+    if session_class is None:
+        return _rembg.new_session(model_name, **session_kwargs)
+    
+    sess_opts = ort.SessionOptions()
+    sess_opts.intra_op_num_threads = onnx_threads
+    sess_opts.inter_op_num_threads = 1
+    return session_class(model_name, sess_opts, None, **session_kwargs)
+
+
+class RembgSessionCache:
+    """
+    rembg模型会话缓存
+    
+    按模型名保存最近使用的会话，超出容量时释放最久未使用的会话，
+    避免切换模型时重复加载，也避免同时常驻过多模型占用内存。
+    """
+    
+    def __init__(self, max_sessions=2):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, model_name='u2net', onnx_threads=None, model_path=None):
+        """
+        获取模型会话，不存在时创建
+        """
+        key = (model_name, model_path, onnx_threads)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = create_rembg_session(model_name, onnx_threads, model_path)
+                self._sessions[key] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(key)
+            return session
+    
+    def clear(self):
+        """
+        释放所有已加载的会话
+        """
+        with self._lock:
+            self._sessions.clear()
+
+
+# 进程内共享的会话缓存
+rembg_sessions = RembgSessionCache()
 
 
 class BackgroundRemover:
-    def __init__(self):
-        self.supported_formats = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
-        self.methods = ['rembg', 'grabcut', 'watershed', 'kmeans', 'threshold']
+    # 批量rembg推理时每次送入ONNX会话的图片数
+    REMBG_BATCH_SIZE = 8
+    # K-means拟合聚类中心时抽样的像素数
+    KMEANS_SAMPLE_SIZE = 20000
+    
+    # method='auto'的分析参数
+    AUTO_ANALYSIS_SIZE = 256         # 分析用缩略图的最长边
+    AUTO_BORDER_TOLERANCE = 12       # 边框像素与边框中值颜色的最大允许偏差
+    AUTO_UNIFORM_BORDER_RATIO = 0.9  # 边框颜色一致的像素比例达到此值视为纯色背景
+    AUTO_BIMODALITY_MIN = 0.75       # 灰度直方图双峰程度（类间方差/总方差）
+    AUTO_ALPHA_MIN_RATIO = 0.01      # 已有透明像素比例达到此值时直接沿用原alpha
+    
+    # 抠像默认的 (内阈值, 外阈值)，单位为CrCb色度距离
+    CHROMAKEY_TOLERANCE = (18, 40)
+    
+    # 帧序列模式的参数（帧差都在AUTO_ANALYSIS_SIZE缩略图的灰度上计算）
+    SEQUENCE_METHODS = ('rembg', 'grabcut', 'grabcut_fast')
+    SEQUENCE_KEYFRAME_INTERVAL = 30   # 每隔多少帧从头计算一次掩码，避免误差累积
+    SEQUENCE_PIXEL_TOLERANCE = 10     # 对齐后灰度差超过此值的像素视为有变化
+    SEQUENCE_REUSE_RATIO = 0.005      # 有变化的像素比例不超过此值时直接复用上一帧掩码
+    SEQUENCE_CUT_DIFF = 40            # 平均灰度差超过此值视为镜头切换
+    SEQUENCE_GRABCUT_ITERATIONS = 2   # 由上一帧传播时GrabCut的最多迭代次数
+    SEQUENCE_BAND_RADIUS = 8          # 由上一帧传播时边界不确定带的半径（像素）
+    
+    # 分条带的分水岭：光晕的初始行数，以及距离变换最大值之外形态学运算需要的行数
+    WATERSHED_HALO = 128
+    WATERSHED_HALO_MARGIN = 16
+    
+    # 批量处理流水线：读取线程预读解码，写出线程异步编码保存
+    PIPELINE_READ_THREADS = 2
+    PIPELINE_PREFETCH = 4             # 预读的图片数
+    PIPELINE_WRITE_THREADS = 2
+
+    def __init__(self, onnx_threads=None, model='u2net', model_path=None, output_mode='rgba'):
+        self.supported_formats = list(IMAGE_EXTENSIONS)
+        self.methods = ['rembg', 'grabcut', 'grabcut_fast', 'watershed', 'kmeans', 'threshold', 'chromakey']
         
-        # 初始化rembg会话（如果可用）
-        if REMBG_AVAILABLE:
-            try:
-                self.rembg_session = new_session('u2net')  # 默认使用u2net模型
-            except Exception as e:
-                print(f"rembg初始化失败: {e}")
-                self.rembg_session = None
-        else:
-            self.rembg_session = None
+        # rembg会话在第一次使用时才创建
+        self.rembg_model = model  # 默认使用u2net模型
+        self.rembg_model_path = model_path
+        self.onnx_threads = onnx_threads
+        self._rembg_failed = set()
+        
+        # 批量K-means时上一张图片的聚类中心
+        self._kmeans_centers = None
+        
+        # 抠像查找表缓存 ((幕布颜色, 阈值), 查找表)
+        self._chromakey_lut_cache = None
+        
+        # 所有方法共用的掩码合成与保存
+        self.writer = MaskWriter(output_mode)
+    
+    @property
+    def rembg_session(self):
+        """
+        默认模型的rembg会话，首次访问时才导入rembg并加载模型，不可用时为None
+        """
+        return self.get_rembg_session()
+    
+    def resolve_model(self, model=None, model_path=None):
+        """
+        解析实际使用的 (rembg模型名, 自定义模型路径)，都为None时使用实例的默认模型
+        """
+        if model is None and model_path is None:
+            model, model_path = self.rembg_model, self.rembg_model_path
+        return resolve_rembg_model(model, model_path)
+    
+    def get_rembg_session(self, model=None, model_path=None):
+        """
+        获取指定模型的rembg会话，不可用时返回None
+        
+        Args:
+            model (str): rembg模型名或.onnx文件路径，None使用默认模型
+            model_path (str): 自定义ONNX模型路径
+        """
+        model_name, model_path = self.resolve_model(model, model_path)
+        
+        key = (model_name, model_path)
+        if key in self._rembg_failed or not rembg_available():
+            return None
+        try:
+            return rembg_sessions.get(model_name, self.onnx_threads, model_path)
+        except Exception as e:
+            print(f"rembg初始化失败: {e}")
+            self._rembg_failed.add(key)
+            return None
     
-    def remove_background_rembg(self, image_path, output_path):
+    def remove_background_rembg(self, image_path, output_path, model=None, model_path=None):
         """
         使用rembg AI模型去除背景（推荐方法）
         """
-        if not REMBG_AVAILABLE or self.rembg_session is None:
+        session = self.get_rembg_session(model, model_path)
+        if session is None:
             raise ValueError("rembg库不可用，请安装: pip install rembg")
         
         try:
             # 读取图片
-            with open(image_path, 'rb') as input_file:
-                input_data = input_file.read()
+            img = cv2.imread(image_path)
+            if img is None:
+                raise ValueError(f"无法读取图片: {image_path}")
             
-            # 使用rembg去除背景
-            output_data = remove(input_data, session=self.rembg_session)
+            # 使用rembg计算掩码
+            mask = _rembg.remove(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), session=session, only_mask=True)
             
             # 保存结果
-            with open(output_path, 'wb') as output_file:
-                output_file.write(output_data)
-            
-            return True
+            return self.writer.write(output_path, img, mask)
         except Exception as e:
             print(f"rembg处理失败: {e}")
             return False
     
+    def rembg_batch_supported(self, model=None, model_path=None):
+        """
+        rembg会话是否支持数组批量推理（只输出单张掩码的模型才支持）
+        """
+        session = self.get_rembg_session(model, model_path)
+        return session is not None and getattr(session, 'model_name', None) in REMBG_MODEL_PARAMS
+    
+    def predict_rembg_masks(self, images, batch_size=None, model=None, model_path=None):
+        """
+        对一组BGR图像直接运行rembg的ONNX会话，返回掩码
+        
+        跳过rembg.remove的字节解码/PNG编码，多张图片拼成一个batch一次推理；
+        模型输入batch维度固定时自动退回逐张推理。
+        
+        Args:
+            images (list): BGR图像数组列表（cv2.imread的结果）
+            batch_size (int): 每次推理的图片数，None使用REMBG_BATCH_SIZE
+            model (str): rembg模型名或.onnx文件路径，None使用默认模型
+            model_path (str): 自定义ONNX模型路径
+            
+        Returns:
+            list: 与输入一一对应、与原图同尺寸的uint8掩码
+        """
+        if not self.rembg_batch_supported(model, model_path):
+            raise ValueError("当前rembg模型不支持批量推理，请安装: pip install rembg")
+        
+        session = self.get_rembg_session(model, model_path)
+        mean, std, size = REMBG_MODEL_PARAMS[session.model_name]
+        mean = np.array(mean, dtype=np.float32)
+        std = np.array(std, dtype=np.float32)
+        
+        inner_session = session.inner_session
+        model_input = inner_session.get_inputs()[0]
+        batch_size = batch_size or self.REMBG_BATCH_SIZE
+        if isinstance(model_input.shape[0], int) and model_input.shape[0] > 0:
+            # 导出时batch维度写死的模型只能逐张推理
+            batch_size = 1
+        
+        masks = []
+        for start in range(0, len(images), batch_size):
+            chunk = images[start:start + batch_size]
+            blob = np.stack([self._rembg_preprocess(img, mean, std, size) for img in chunk])
+            try:
+                preds = inner_session.run(None, {model_input.name: blob})[0]
+            except Exception:
+                if len(chunk) == 1:
+                    raise
+                preds = np.concatenate([
+                    inner_session.run(None, {model_input.name: blob[j:j + 1]})[0]
+                    for j in range(len(chunk))
+                ])
+            
+            for img, pred in zip(chunk, preds[:, 0]):
+                masks.append(self._rembg_postprocess(pred, img.shape[:2]))
+        
+        return masks
+    
+    def remove_background_rembg_array(self, img, model=None, model_path=None):
+        """
+        rembg去背景的数组接口：输入BGR图像，返回按输出模式合成的图像（默认BGRA），
+        不做任何编解码
+        """
+        mask = self.predict_rembg_masks([img], model=model, model_path=model_path)[0]
+        return self.writer.compose(img, mask)
+    
+    @staticmethod
+    def _rembg_preprocess(img, mean, std, size):
+        """
+        BGR图像 -> 模型输入 (3, H, W) float32，对应rembg的normalize
+        """
+        rgb = cv2.resize(img, size, interpolation=cv2.INTER_LANCZOS4)
+        rgb = cv2.cvtColor(rgb, cv2.COLOR_BGR2RGB).astype(np.float32)
+        rgb /= max(float(rgb.max()), 1.0)
+        rgb -= mean
+        rgb /= std
+        return rgb.transpose(2, 0, 1)
+    
+    @staticmethod
+    def _rembg_postprocess(pred, shape):
+        """
+        模型输出 -> 原图尺寸的uint8掩码，对应rembg的predict后处理
+        """
+        mi, ma = float(pred.min()), float(pred.max())
+        if ma > mi:
+            pred = (pred - mi) / (ma - mi)
+        else:
+            pred = np.zeros_like(pred)
+        mask = (pred * 255).astype(np.uint8)
+        height, width = shape
+        return cv2.resize(mask, (width, height), interpolation=cv2.INTER_LANCZOS4)
+    
     def remove_background_grabcut(self, image_path, output_path, iterations=5):
         """
         使用OpenCV GrabCut算法去除背景
@@ -72,6 +591,15 @@ class BackgroundRemover:
         if img is None:
             raise ValueError(f"无法读取图片: {image_path}")
         
+        mask = self._mask_grabcut(img, iterations)
+        
+        # 保存结果
+        return self.writer.write(output_path, img, mask)
+    
+    def _mask_grabcut(self, img, iterations=5):
+        """
+        GrabCut前景掩码（0/255）
+        """
         height, width = img.shape[:2]
         
         # 创建掩码
@@ -89,28 +617,145 @@ class BackgroundRemover:
         cv2.grabCut(img, mask, rect, bgd_model, fgd_model, iterations, cv2.GC_INIT_WITH_RECT)
         
         # 创建最终掩码
-        mask2 = np.where((mask == 2) | (mask == 0), 0, 1).astype('uint8')
-        
-        # 应用掩码
-        result = img * mask2[:, :, np.newaxis]
+        return np.where((mask == 2) | (mask == 0), 0, 255).astype('uint8')
+    
+    def remove_background_grabcut_fast(self, image_path, output_path, iterations=5):
+        """
+        使用金字塔GrabCut去除背景（大图上比grabcut快得多）
+        """
+        # 读取图片
+        img = cv2.imread(image_path)
+        if img is None:
+            raise ValueError(f"无法读取图片: {image_path}")
         
-        # 创建透明背景
-        result_rgba = cv2.cvtColor(result, cv2.COLOR_BGR2BGRA)
-        result_rgba[:, :, 3] = mask2 * 255
+        mask = self._mask_grabcut_fast(img, iterations)
         
         # 保存结果
-        cv2.imwrite(output_path, result_rgba)
-        return True
+        return self.writer.write(output_path, img, mask)
+    
+    def _mask_grabcut_fast(self, img, iterations=5, coarse_size=400, band_radius=3, tol=0.001):
+        """
+        由粗到细的金字塔GrabCut前景掩码（0/255）
+        
+        先在最粗一层用矩形初始化做完整分割；之后逐层放大掩码，内部和外部
+        固定为确定前景/背景，只把边界附近的不确定带裁出来用GC_INIT_WITH_MASK
+        细化。每层迭代在掩码不再变化时提前停止。
+        
+        Args:
+            img (numpy.ndarray): BGR图像
+            iterations (int): 每层最多迭代次数
+            coarse_size (int): 最粗一层的最长边上限
+            band_radius (int): 每层边界不确定带的半径（像素）
+            tol (float): 单次迭代前景变化比例低于此值时停止
+        """
+        pyramid = [img]
+        while max(pyramid[-1].shape[:2]) > coarse_size:
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+        
+        # 最粗一层：与grabcut相同的矩形初始化
+        coarse = pyramid[-1]
+        height, width = coarse.shape[:2]
+        margin = min(width, height) // 10
+        rect = (margin, margin, width - 2*margin, height - 2*margin)
+        mask = np.zeros((height, width), np.uint8)
+        self._grabcut_until_stable(coarse, mask, rect, iterations, tol, cv2.GC_INIT_WITH_RECT)
+        fg = ((mask == cv2.GC_FGD) | (mask == cv2.GC_PR_FGD)).astype(np.uint8)
+        
+        for level in reversed(pyramid[:-1]):
+            height, width = level.shape[:2]
+            fg = cv2.resize(fg, (width, height), interpolation=cv2.INTER_NEAREST)
+            fg = self._refine_band(level, fg, band_radius, iterations, tol)
+        
+        return fg * 255
+    
+    def _refine_band(self, img, fg, band_radius, iterations, tol=0.001):
+        """
+        以已有的前景（0/1）为初值，只在边界附近用GrabCut细化
+        
+        内部和外部固定为确定前景/背景，边界不确定带的外接矩形（留出余量
+        供GMM取样）裁出来用GC_INIT_WITH_MASK迭代。
+        
+        Args:
+            img (numpy.ndarray): BGR图像
+            fg (numpy.ndarray): 与图像同尺寸的初始前景（0/1）
+            band_radius (int): 边界不确定带的半径（像素）
+            iterations (int): 最多迭代次数
+            tol (float): 单次迭代前景变化比例低于此值时停止
+            
+        Returns:
+            numpy.ndarray: 细化后的前景（0/1）
+        """
+        height, width = img.shape[:2]
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * band_radius + 1, 2 * band_radius + 1))
+        
+        # 边界带内为可能前景/背景，带外固定
+        inner = cv2.erode(fg, kernel)
+        outer = cv2.dilate(fg, kernel)
+        mask = np.full((height, width), cv2.GC_BGD, np.uint8)
+        mask[outer > 0] = cv2.GC_PR_BGD
+        mask[fg > 0] = cv2.GC_PR_FGD
+        mask[inner > 0] = cv2.GC_FGD
+        
+        band = cv2.subtract(outer, inner)
+        points = cv2.findNonZero(band)
+        if points is None:
+            return fg
+        
+        # 只在边界带的外接矩形（留出余量供GMM取样）内细化
+        x, y, w, h = cv2.boundingRect(points)
+        pad = 4 * band_radius
+        x0, y0 = max(0, x - pad), max(0, y - pad)
+        x1, y1 = min(width, x + w + pad), min(height, y + h + pad)
+        sub_mask = mask[y0:y1, x0:x1].copy()
+        try:
+            self._grabcut_until_stable(np.ascontiguousarray(img[y0:y1, x0:x1]), sub_mask,
+                                       None, iterations, tol, cv2.GC_INIT_WITH_MASK)
+        except cv2.error:
+            # 裁剪区域缺少前景或背景样本时保留原来的掩码
+            return fg
+        mask[y0:y1, x0:x1] = sub_mask
+        return ((mask == cv2.GC_FGD) | (mask == cv2.GC_PR_FGD)).astype(np.uint8)
+    
+    @staticmethod
+    def _grabcut_until_stable(img, mask, rect, iterations, tol, mode):
+        """
+        逐次迭代GrabCut，前景变化比例不超过tol时提前停止（mask原地更新）
+        """
+        bgd_model = np.zeros((1, 65), np.float64)
+        fgd_model = np.zeros((1, 65), np.float64)
+        previous = None
+        for i in range(max(1, iterations)):
+            cv2.grabCut(img, mask, rect, bgd_model, fgd_model, 1, mode if i == 0 else cv2.GC_EVAL)
+            fg = (mask == cv2.GC_FGD) | (mask == cv2.GC_PR_FGD)
+            if previous is not None and np.count_nonzero(fg != previous) <= tol * fg.size:
+                break
+            previous = fg
+        return mask
     
-    def remove_background_watershed(self, image_path, output_path):
+    def remove_background_watershed(self, image_path, output_path, tile_rows=None):
         """
         使用分水岭算法去除背景
+        
+        tile_rows不为空时按该行数分条带处理，见_tiled_watershed。
         """
         # 读取图片
         img = cv2.imread(image_path)
         if img is None:
             raise ValueError(f"无法读取图片: {image_path}")
         
+        if tile_rows:
+            self._tiled_watershed(img, output_path, tile_rows)
+            return True
+        
+        mask = self._mask_watershed(img)
+        
+        # 保存结果
+        return self.writer.write(output_path, img, mask)
+    
+    def _mask_watershed(self, img):
+        """
+        分水岭前景掩码（0/255）
+        """
         # 转换为灰度图
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         
@@ -143,64 +788,107 @@ class BackgroundRemover:
         # 创建掩码
         mask = np.zeros(gray.shape, dtype=np.uint8)
         mask[markers > 1] = 255
-        
-        # 应用掩码
-        result = img.copy()
-        result_rgba = cv2.cvtColor(result, cv2.COLOR_BGR2BGRA)
-        result_rgba[:, :, 3] = mask
-        
-        # 保存结果
-        cv2.imwrite(output_path, result_rgba)
-        return True
+        return mask
     
-    def remove_background_kmeans(self, image_path, output_path, k=3):
+    def remove_background_kmeans(self, image_path, output_path, k=3, reuse_centers=False):
         """
         使用K-means聚类去除背景
+        
+        reuse_centers为True时以上一张图片的聚类中心为初值，只做少量迭代，
+        适合批量处理颜色分布相近的图片。
         """
         # 读取图片
         img = cv2.imread(image_path)
         if img is None:
             raise ValueError(f"无法读取图片: {image_path}")
         
-        # 重塑数据
-        data = img.reshape((-1, 3))
-        data = np.float32(data)
+        mask = self._mask_kmeans(img, k, reuse_centers)
         
-        # 定义停止条件
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
+        # 保存结果
+        return self.writer.write(output_path, img, mask)
+    
+    def _mask_kmeans(self, img, k=3, reuse_centers=False):
+        """
+        K-means前景掩码（0/255），最大的聚类视为背景
         
-        # 应用K-means
-        _, labels, centers = cv2.kmeans(data, k, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+        聚类中心只在随机抽样的像素上拟合，再把全部像素一次性分配到最近的中心。
+        """
+        data = img.reshape((-1, 3))
         
-        # 转换回uint8并重塑
-        centers = np.uint8(centers)
-        segmented_data = centers[labels.flatten()]
-        segmented_image = segmented_data.reshape(img.shape)
+        # 随机抽样拟合聚类中心（固定种子，同一张图结果稳定）
+        if len(data) > self.KMEANS_SAMPLE_SIZE:
+            rng = np.random.default_rng(0)
+            sample = data[rng.choice(len(data), self.KMEANS_SAMPLE_SIZE, replace=False)]
+        else:
+            sample = data
+        sample = np.float32(sample)
         
-        # 假设最大的聚类是背景，创建掩码
-        unique, counts = np.unique(labels, return_counts=True)
-        background_label = unique[np.argmax(counts)]
+        centers = self._kmeans_centers if reuse_centers else None
+        if centers is not None and len(centers) == k:
+            # 以上一张图片的中心为初值做几次Lloyd迭代
+            for _ in range(3):
+                sample_labels = self._assign_nearest(sample, centers)
+                for label in range(k):
+                    members = sample[sample_labels == label]
+                    if len(members):
+                        centers[label] = members.mean(axis=0)
+        else:
+            # 定义停止条件
+            criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
+            
+            # 应用K-means
+            _, _, centers = cv2.kmeans(sample, k, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+        self._kmeans_centers = centers
         
-        mask = np.where(labels.flatten() == background_label, 0, 255).astype(np.uint8)
-        mask = mask.reshape(img.shape[:2])
+        labels = self._assign_nearest(data, centers)
         
-        # 应用掩码
-        result_rgba = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
-        result_rgba[:, :, 3] = mask
+        # 假设最大的聚类是背景，创建掩码
+        background_label = np.argmax(np.bincount(labels, minlength=k))
         
-        # 保存结果
-        cv2.imwrite(output_path, result_rgba)
-        return True
+        mask = np.where(labels == background_label, 0, 255).astype(np.uint8)
+        return mask.reshape(img.shape[:2])
+    
+    @staticmethod
+    def _assign_nearest(data, centers, chunk_size=1 << 20):
+        """
+        把每个像素分配到最近的聚类中心，分块计算以限制临时内存
+        """
+        centers = np.float32(centers)
+        # |x-c|^2 = |x|^2 - 2x·c + |c|^2，|x|^2对同一像素是常数可略去
+        weights = -2 * centers.T
+        offsets = np.sum(centers * centers, axis=1)
+        labels = np.empty(len(data), np.uint8)
+        for start in range(0, len(data), chunk_size):
+            block = np.float32(data[start:start + chunk_size])
+            distances = block @ weights
+            distances += offsets
+            labels[start:start + chunk_size] = np.argmin(distances, axis=1)
+        return labels
     
-    def remove_background_threshold(self, image_path, output_path, threshold_value=None):
+    def remove_background_threshold(self, image_path, output_path, threshold_value=None, tile_rows=None):
         """
         使用简单阈值方法去除背景（适用于纯色背景）
+        
+        tile_rows不为空时按该行数分条带处理，见_tiled_threshold。
         """
         # 读取图片
         img = cv2.imread(image_path)
         if img is None:
             raise ValueError(f"无法读取图片: {image_path}")
         
+        if tile_rows:
+            self._tiled_threshold(img, output_path, threshold_value, tile_rows)
+            return True
+        
+        mask = self._mask_threshold(img, threshold_value)
+        
+        # 保存结果
+        return self.writer.write(output_path, img, mask)
+    
+    def _mask_threshold(self, img, threshold_value=None):
+        """
+        阈值法前景掩码（0/255），假设背景是较亮的区域
+        """
         # 转换为灰度图
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         
@@ -219,101 +907,1090 @@ class BackgroundRemover:
         kernel = np.ones((5, 5), np.uint8)
         mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
         mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-        
-        # 应用掩码
-        result_rgba = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
-        result_rgba[:, :, 3] = mask
-        
-        # 保存结果
-        cv2.imwrite(output_path, result_rgba)
-        return True
+        return mask
     
-    def process_image(self, image_path, output_path, method='rembg', **kwargs):
+    def remove_background_chromakey(self, image_path, output_path, key_color=None,
+                                    tolerance=None, spill=True):
         """
-        处理单张图片
+        绿幕/蓝幕抠像（软边alpha + 溢色抑制）
         
         Args:
             image_path (str): 输入图片路径
             output_path (str): 输出图片路径
-            method (str): 去背景方法
-            **kwargs: 方法特定参数
+            key_color (tuple): 幕布颜色 (B, G, R)，None时由边框像素自动估计
+            tolerance (tuple): (内阈值, 外阈值)，CrCb色度距离小于内阈值完全透明，
+                大于外阈值完全不透明，之间线性过渡
+            spill (bool): 是否抑制前景边缘的幕布溢色
         """
-        # 检查输入文件
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"图片文件不存在: {image_path}")
+        # 读取图片
+        img = cv2.imread(image_path)
+        if img is None:
+            raise ValueError(f"无法读取图片: {image_path}")
         
-        file_ext = Path(image_path).suffix.lower()
-        if file_ext not in self.supported_formats:
-            raise ValueError(f"不支持的图片格式: {file_ext}")
+        img, mask = self._chromakey(img, key_color, tolerance, spill)
         
-        # 确保输出目录存在
-        output_dir = os.path.dirname(output_path)
-        if output_dir:  # 只有当输出路径包含目录时才创建目录
-            os.makedirs(output_dir, exist_ok=True)
+        # 保存结果
+        return self.writer.write(output_path, img, mask)
+    
+    def chromakey_frame(self, img, key_color=None, tolerance=None, spill=True):
+        """
+        对一帧BGR图像抠像，返回按输出模式合成的新图像（默认BGRA）
+        """
+        return self.writer.compose(*self._chromakey(img, key_color, tolerance, spill))
+    
+    def _chromakey(self, img, key_color=None, tolerance=None, spill=True, small=None):
+        """
+        抠像，返回 (去溢色后的BGR图像, alpha掩码)
         
-        # 根据方法选择处理函数
-        if method == 'rembg':
-            return self.remove_background_rembg(image_path, output_path)
-        elif method == 'grabcut':
-            return self.remove_background_grabcut(image_path, output_path, 
+        给出缩小图small时alpha在缩小图上计算（与small同尺寸），溢色抑制仍作用于原图
+        """
+        if small is None:
+            small = img
+        if key_color is None:
+            key_color = self.estimate_key_color(small)
+        mask = self._mask_chromakey(small, key_color, tolerance)
+        if spill:
+            img = self._suppress_spill(img, key_color)
+        return img, mask
+    
+    def estimate_key_color(self, img):
+        """
+        由边框像素的中值估计幕布颜色 (B, G, R)
+        """
+        border = self._border_pixels(self._thumbnail(img))
+        return tuple(int(c) for c in np.median(border, axis=0))
+    
+    def _mask_chromakey(self, img, key_color=None, tolerance=None):
+        """
+        抠像alpha：YCrCb色彩空间中到幕布颜色的色度距离，按内外阈值线性映射为0-255
+        
+        只比较色度（Cr、Cb），不受幕布打光明暗不均的影响。alpha只取决于
+        (Cr, Cb)，因此先算出256x256的查找表，每个像素只做一次查表。
+        """
+        if key_color is None:
+            key_color = self.estimate_key_color(img)
+        lut = self._chromakey_lut(tuple(int(c) for c in key_color), tuple(tolerance or self.CHROMAKEY_TOLERANCE))
+        
+        ycrcb = cv2.cvtColor(img, cv2.COLOR_BGR2YCrCb)
+        index = ycrcb[:, :, 1].astype(np.uint16) << 8
+        index |= ycrcb[:, :, 2]
+        return lut[index]
+    
+    def _chromakey_lut(self, key_color, tolerance):
+        """
+        (Cr, Cb) -> alpha 查找表，按幕布颜色和阈值缓存
+        """
+        cached = self._chromakey_lut_cache
+        if cached is not None and cached[0] == (key_color, tolerance):
+            return cached[1]
+        
+        inner, outer = tolerance
+        key_ycrcb = cv2.cvtColor(np.uint8([[key_color]]), cv2.COLOR_BGR2YCrCb)[0, 0]
+        levels = np.arange(256, dtype=np.float32)
+        distance = np.hypot((levels - float(key_ycrcb[1]))[:, None], (levels - float(key_ycrcb[2]))[None, :])
+        alpha = np.clip((distance - inner) * (255.0 / max(outer - inner, 1e-6)), 0, 255)
+        lut = np.round(alpha).astype(np.uint8).ravel()
+        
+        self._chromakey_lut_cache = ((key_color, tolerance), lut)
+        return lut
+    
+    def _suppress_spill(self, img, key_color):
+        """
+        溢色抑制：把幕布主色通道限制在另外两个通道的最大值以内
+        
+        幕布颜色饱和度不足（灰色/白色背景）时不做处理。
+        """
+        key_ycrcb = cv2.cvtColor(np.uint8([[key_color]]), cv2.COLOR_BGR2YCrCb)[0, 0]
+        if np.hypot(int(key_ycrcb[1]) - 128, int(key_ycrcb[2]) - 128) < 20:
+            return img
+        
+        channel = int(np.argmax(key_color))
+        others = [c for c in range(3) if c != channel]
+        channels = list(cv2.split(img))
+        channels[channel] = cv2.min(channels[channel], cv2.max(channels[others[0]], channels[others[1]]))
+        return cv2.merge(channels)
+    
+    def chromakey_video(self, video_path, output_dir, frame_rate=None, start_time=0, end_time=None,
+                        key_color=None, tolerance=None, spill=True, quality=3, encode_threads=None):
+        """
+        直接对视频逐帧抠像并输出透明PNG序列
+        
+        帧由VideoToPNG.iter_frames解码（不经过中间PNG），文件名与extract_frames
+        相同；幕布颜色未指定时只在第一帧上估计一次，整段保持一致；
+        PNG编码由多个写线程并行完成。
+        
+        Returns:
+            int: 成功保存的帧数
+        """
+        from video_to_png import VideoToPNG, FrameWriterPool, default_encode_threads
+        
+        os.makedirs(output_dir, exist_ok=True)
+        converter = VideoToPNG()
+        writer = FrameWriterPool(encode_threads or default_encode_threads(), quality)
+        
+        processed = 0
+        try:
+            frames = converter.iter_frames(video_path, frame_rate, start_time, end_time, reuse_buffer=True)
+            for frame_index, timestamp, frame in frames:
+                if key_color is None:
+                    key_color = self.estimate_key_color(frame)
+                    print(f"幕布颜色 (B, G, R): {key_color}")
+                keyed = self.chromakey_frame(frame, key_color, tolerance, spill)
+                filename = f"frame_{frame_index:06d}_{timestamp:.3f}s.png"
+                writer.submit(os.path.join(output_dir, filename), keyed)
+                processed += 1
+                if processed % 100 == 0:
+                    print(f"\r  已处理 {processed} 帧", end="", flush=True)
+        except KeyboardInterrupt:
+            print("\n用户中断操作")
+        finally:
+            writer.close()
+        
+        if writer.error is not None:
+            print(f"\n写入错误: {writer.error}")
+        print(f"\n抠像完成！保存 {writer.saved_count} 帧到: {output_dir}")
+        return writer.saved_count
+    
+    def _iter_strips(self, height, tile_rows, halo):
+        """
+        生成条带范围 (读取起始行, 读取结束行, 条带起始行, 条带结束行)，读取范围上下各带halo行
+        """
+        for y0 in range(0, height, tile_rows):
+            y1 = min(height, y0 + tile_rows)
+            yield max(0, y0 - halo), min(height, y1 + halo), y0, y1
+    
+    def _gray_histogram(self, img, tile_rows):
+        """
+        逐条带累加灰度直方图
+        """
+        hist = np.zeros(256, np.float64)
+        for _, _, y0, y1 in self._iter_strips(img.shape[0], tile_rows, 0):
+            gray = cv2.cvtColor(img[y0:y1], cv2.COLOR_BGR2GRAY)
+            hist += cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+        return hist
+    
+    def _tiled_threshold(self, img, output_path, threshold_value, tile_rows):
+        """
+        分条带的阈值法去背景，逐条带计算掩码并增量写出PNG
+        
+        Otsu阈值由逐条带累加的直方图求出；形态学闭/开运算各需要上下4行，
+        因此每个条带带8行光晕读取，结果与整图处理逐像素一致。
+        灰度图、掩码和BGRA输出都只按条带大小分配。
+        """
+        height, width = img.shape[:2]
+        if threshold_value is None:
+            threshold_value = otsu_threshold_from_hist(self._gray_histogram(img, tile_rows))
+        
+        kernel = np.ones((5, 5), np.uint8)
+        writer = self.writer.strip_writer(output_path, width, height)
+        buffer = None
+        try:
+            for r0, r1, y0, y1 in self._iter_strips(height, tile_rows, 8):
+                gray = cv2.cvtColor(img[r0:r1], cv2.COLOR_BGR2GRAY)
+                _, mask = cv2.threshold(gray, threshold_value, 255, cv2.THRESH_BINARY)
+                mask = cv2.bitwise_not(mask)
+                mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+                mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+                buffer = self.writer.compose(img[y0:y1], mask[y0 - r0:y1 - r0], buffer)
+                writer.write(buffer)
+        finally:
+            writer.close()
+    
+    def _tiled_watershed(self, img, output_path, tile_rows, halo=None):
+        """
+        分条带的分水岭去背景，逐条带计算掩码并增量写出PNG
+        
+        Otsu阈值和距离变换的最大值先逐条带求出整图的值，之后每个条带带
+        光晕做开运算、距离变换、连通域标记和分水岭，只保留中间部分。
+        光晕由数据决定，保证结果与整图处理一致：
+        - 像素的距离变换只取决于上下dist_max行以内的像素，第一遍求出的最大值
+          （加上形态学需要的行数）超过光晕时加大光晕重新求；
+        - 分水岭只在不确定区域内从标记向外淹没，条带内的不确定区域延伸到
+          光晕边缘时，该条带加大光晕重新计算。
+        物体或不确定区域很大时光晕会增长到接近整图高度，条带的内存优势随之减小。
+        """
+        height, width = img.shape[:2]
+        threshold_value = otsu_threshold_from_hist(self._gray_histogram(img, tile_rows))
+        kernel = np.ones((3, 3), np.uint8)
+        
+        def opening_of(r0, r1):
+            gray = cv2.cvtColor(img[r0:r1], cv2.COLOR_BGR2GRAY)
+            _, thresh = cv2.threshold(gray, threshold_value, 255, cv2.THRESH_BINARY_INV)
+            return cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel, iterations=2)
+        
+        # 第一遍：整图距离变换最大值。条带的距离变换在光晕以内都准确时
+        # 求出的最大值小于光晕，否则加大光晕重新计算
+        halo = halo or self.WATERSHED_HALO
+        while True:
+            dist_max = 0.0
+            for r0, r1, y0, y1 in self._iter_strips(height, tile_rows, halo):
+                dist_transform = cv2.distanceTransform(opening_of(r0, r1), cv2.DIST_L2, 5)
+                dist_max = max(dist_max, float(dist_transform[y0 - r0:y1 - r0].max()))
+            if dist_max + self.WATERSHED_HALO_MARGIN <= halo or halo >= height:
+                break
+            halo = max(halo * 2, int(dist_max) + self.WATERSHED_HALO_MARGIN)
+        
+        def strip_mask(y0, y1, strip_halo):
+            r0, r1 = max(0, y0 - strip_halo), min(height, y1 + strip_halo)
+            opening = opening_of(r0, r1)
+            sure_bg = cv2.dilate(opening, kernel, iterations=3)
+            dist_transform = cv2.distanceTransform(opening, cv2.DIST_L2, 5)
+            _, sure_fg = cv2.threshold(dist_transform, 0.7 * dist_max, 255, 0)
+            sure_fg = np.uint8(sure_fg)
+            unknown = cv2.subtract(sure_bg, sure_fg)
+            
+            # 与条带相连的不确定区域碰到光晕的截断边时，分水岭的结果依赖光晕外的像素
+            _, regions = cv2.connectedComponents(unknown)
+            cut_rows = [row for row, cut in ((0, r0 > 0), (r1 - r0 - 1, r1 < height)) if cut]
+            if cut_rows:
+                crossing = np.intersect1d(np.unique(regions[y0 - r0:y1 - r0]),
+                                          np.unique(regions[cut_rows]))
+                if np.any(crossing > 0):
+                    return None
+            
+            _, markers = cv2.connectedComponents(sure_fg)
+            markers = markers + 1
+            markers[unknown == 255] = 0
+            markers = cv2.watershed(np.ascontiguousarray(img[r0:r1]), markers)
+            return np.where(markers[y0 - r0:y1 - r0] > 1, 255, 0).astype(np.uint8)
+        
+        # 第二遍：逐条带分水岭
+        writer = self.writer.strip_writer(output_path, width, height)
+        buffer = None
+        try:
+            for _, _, y0, y1 in self._iter_strips(height, tile_rows, 0):
+                strip_halo = halo
+                mask = strip_mask(y0, y1, strip_halo)
+                while mask is None:
+                    strip_halo *= 2
+                    mask = strip_mask(y0, y1, strip_halo)
+                buffer = self.writer.compose(img[y0:y1], mask, buffer)
+                writer.write(buffer)
+        finally:
+            writer.close()
+    
+    def analyze_image(self, img, alpha=None):
+        """
+        对图片做一次廉价的向量化分析，供method='auto'选择方法
+        
+        Args:
+            img (numpy.ndarray): BGR图像
+            alpha (numpy.ndarray): 原图的alpha通道（没有时为None）
+            
+        Returns:
+            dict: transparent_ratio 已透明像素比例，border_uniformity 边框颜色一致比例，
+                border_gray 边框中值颜色的灰度，otsu Otsu阈值，bimodality 灰度直方图双峰程度(0-1)
+        """
+        img = self._thumbnail(img)
+        
+        # 边框（各边约3%宽）颜色的一致程度
+        border = self._border_pixels(img).astype(np.int16)
+        border_color = np.median(border, axis=0)
+        deviation = np.abs(border - border_color).max(axis=1)
+        border_uniformity = float(np.mean(deviation <= self.AUTO_BORDER_TOLERANCE))
+        border_gray = float(np.dot(border_color, (0.114, 0.587, 0.299)))
+        
+        # 灰度直方图在Otsu阈值处的类间方差占总方差的比例
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+        otsu = otsu_threshold_from_hist(hist)
+        p = hist / hist.sum()
+        levels = np.arange(256)
+        mu = float(np.dot(levels, p))
+        variance = float(np.dot((levels - mu) ** 2, p))
+        w0 = float(p[:otsu + 1].sum())
+        w1 = 1.0 - w0
+        bimodality = 0.0
+        if variance > 0 and w0 > 0 and w1 > 0:
+            mu0 = float(np.dot(levels[:otsu + 1], p[:otsu + 1])) / w0
+            mu1 = (mu - w0 * mu0) / w1
+            bimodality = w0 * w1 * (mu0 - mu1) ** 2 / variance
+        
+        transparent_ratio = 0.0
+        if alpha is not None:
+            transparent_ratio = float(np.count_nonzero(alpha < 250)) / alpha.size
+        
+        return {
+            'transparent_ratio': transparent_ratio,
+            'border_uniformity': border_uniformity,
+            'border_gray': border_gray,
+            'otsu': otsu,
+            'bimodality': bimodality,
+        }
+    
+    def _thumbnail(self, img):
+        """
+        缩小到最长边不超过AUTO_ANALYSIS_SIZE的分析用缩略图
+        """
+        height, width = img.shape[:2]
+        scale = min(1.0, self.AUTO_ANALYSIS_SIZE / max(height, width))
+        if scale < 1.0:
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        return img
+    
+    @staticmethod
+    def _border_pixels(img, ratio=0.03):
+        """
+        图像四周边框（各边约ratio宽）的像素，形状为 (N, 3)
+        """
+        b = max(1, round(min(img.shape[:2]) * ratio))
+        return np.concatenate([
+            img[:b].reshape(-1, 3), img[-b:].reshape(-1, 3),
+            img[:, :b].reshape(-1, 3), img[:, -b:].reshape(-1, 3),
+        ])
+    
+    @staticmethod
+    def auto_route_kwargs(route, kwargs):
+        """
+        自动选择方法后调整参数：选中的方法不支持分块时去掉tile_rows，按整图处理
+        """
+        if kwargs.get('tile_rows') and route not in ('threshold', 'watershed'):
+            kwargs = dict(kwargs, tile_rows=None)
+        return kwargs
+    
+    def choose_method(self, image_path):
+        """
+        分析图片并选择最便宜且大概率有效的方法
+        
+        已有透明通道 -> alpha（沿用原alpha）；纯色边框且明亮背景、直方图双峰
+        -> threshold；纯色边框的其他情况 -> kmeans；其余才升级到rembg
+        （rembg不可用时使用grabcut_fast）。
+        
+        Returns:
+            tuple: (方法名, 选择原因)
+        """
+        img, alpha = self._read_with_alpha(image_path)
+        stats = self.analyze_image(img, alpha)
+        
+        if stats['transparent_ratio'] >= self.AUTO_ALPHA_MIN_RATIO:
+            return 'alpha', f"已有透明通道 ({stats['transparent_ratio']:.0%} 像素透明)"
+        
+        if stats['border_uniformity'] >= self.AUTO_UNIFORM_BORDER_RATIO:
+            if stats['bimodality'] >= self.AUTO_BIMODALITY_MIN and stats['border_gray'] > stats['otsu']:
+                return 'threshold', f"纯色浅色背景，灰度双峰 ({stats['bimodality']:.2f})"
+            return 'kmeans', f"纯色背景 (边框一致 {stats['border_uniformity']:.0%})"
+        
+        if rembg_available():
+            return 'rembg', "复杂背景"
+        return 'grabcut_fast', "复杂背景 (rembg不可用)"
+    
+    def keep_existing_alpha(self, image_path, output_path):
+        """
+        图片已带透明通道时直接沿用原alpha保存为PNG
+        """
+        img, alpha = self._read_with_alpha(image_path)
+        if alpha is None:
+            alpha = np.full(img.shape[:2], 255, np.uint8)
+        return self.writer.write(output_path, img, alpha)
+    
+    @staticmethod
+    def _read_with_alpha(image_path):
+        """
+        读取图片，返回 (8位BGR图像, alpha通道或None)
+        """
+        img = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+        if img is None:
+            raise ValueError(f"无法读取图片: {image_path}")
+        
+        if img.dtype == np.uint16:
+            img = (img >> 8).astype(np.uint8)
+        elif img.dtype != np.uint8:
+            img = cv2.convertScaleAbs(img, alpha=255.0)
+        
+        alpha = None
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        elif img.shape[2] == 4:
+            alpha = img[:, :, 3]
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        return img, alpha
+    
+    def compute_mask(self, img, method='rembg', **kwargs):
+        """
+        对BGR图像计算前景掩码，不读写文件
+        
+        Args:
+            img (numpy.ndarray): BGR图像
+            method (str): 去背景方法
+            **kwargs: 方法特定参数
+            
+        Returns:
+            numpy.ndarray: 与图像同尺寸的uint8掩码（255为前景）
+        """
+        if method == 'rembg':
+            return self._mask_rembg(img, kwargs.get('model'), kwargs.get('model_path'))
+        elif method == 'grabcut':
+            return self._mask_grabcut(img, kwargs.get('iterations', 5))
+        elif method == 'grabcut_fast':
+            return self._mask_grabcut_fast(img, kwargs.get('iterations', 5))
+        elif method == 'watershed':
+            return self._mask_watershed(img)
+        elif method == 'kmeans':
+            return self._mask_kmeans(img, kwargs.get('k', 3), kwargs.get('reuse_centers', False))
+        elif method == 'threshold':
+            return self._mask_threshold(img, kwargs.get('threshold_value', None))
+        elif method == 'chromakey':
+            return self._mask_chromakey(img, kwargs.get('key_color'), kwargs.get('key_tolerance'))
+        else:
+            raise ValueError(f"不支持的方法: {method}")
+    
+    def _mask_rembg(self, img, model=None, model_path=None):
+        """
+        rembg掩码：支持数组推理的模型直接运行ONNX会话，其余模型退回rembg.remove
+        """
+        if self.rembg_batch_supported(model, model_path):
+            return self.predict_rembg_masks([img], model=model, model_path=model_path)[0]
+        session = self.get_rembg_session(model, model_path)
+        if session is None:
+            raise ValueError("rembg库不可用，请安装: pip install rembg")
+        return _rembg.remove(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), session=session, only_mask=True)
+    
+    def _compute_scaled(self, img, small, method, kwargs):
+        """
+        在计算用图像small上计算掩码，返回 (要合成的原图, 掩码)
+        
+        抠像的溢色抑制作用于原图，只有alpha在缩小图上计算
+        """
+        if method == 'chromakey':
+            return self._chromakey(img, kwargs.get('key_color'), kwargs.get('key_tolerance'),
+                                   kwargs.get('spill', True), small)
+        return img, self.compute_mask(small, method, **kwargs)
+    
+    def _read_scaled(self, image_path, mask_scale):
+        """
+        读取原图和用于计算掩码的缩小图
+        
+        合成输出需要原图，缩小图由已解码的原图按INTER_AREA缩小
+        （对JPEG再做一次缩小解码比缩放已解码的原图更慢）。
+        """
+        img = cv2.imread(image_path)
+        if img is None:
+            raise ValueError(f"无法读取图片: {image_path}")
+        
+        height, width = img.shape[:2]
+        size = (max(1, round(width * mask_scale)), max(1, round(height * mask_scale)))
+        small = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        return img, small
+    
+    def _process_image_scaled(self, image_path, output_path, method, mask_scale, kwargs):
+        """
+        在缩小图上计算掩码，再以原图为引导做保边上采样后合成
+        """
+        img, small = self._read_scaled(image_path, mask_scale)
+        img, mask = self._compute_scaled(img, small, method, kwargs)
+        return self.writer.write(output_path, img, guided_upsample_mask(mask, img))
+    
+    def process_image(self, image_path, output_path, method='rembg', **kwargs):
+        """
+        处理单张图片
+        
+        Args:
+            image_path (str): 输入图片路径
+            output_path (str): 输出图片路径
+            method (str): 去背景方法，'auto'为先分析图片再自动选择方法
+            **kwargs: 方法特定参数；mask_scale (0-1) 表示在按该比例缩小的图上
+                计算掩码，再以原图为引导保边上采样，适合4K/8K大图
+        """
+        # 检查输入文件
+        if not os.path.exists(image_path):
+            raise FileNotFoundError(f"图片文件不存在: {image_path}")
+        
+        file_ext = Path(image_path).suffix.lower()
+        if file_ext not in self.supported_formats:
+            raise ValueError(f"不支持的图片格式: {file_ext}")
+        
+        # 确保输出目录存在
+        output_dir = os.path.dirname(output_path)
+        if output_dir:  # 只有当输出路径包含目录时才创建目录
+            os.makedirs(output_dir, exist_ok=True)
+        
+        if method == 'auto':
+            method, _ = self.choose_method(image_path)
+            kwargs = self.auto_route_kwargs(method, kwargs)
+        if method == 'alpha':
+            return self.keep_existing_alpha(image_path, output_path)
+        
+        mask_scale = kwargs.get('mask_scale')
+        if mask_scale is not None and not 0 < mask_scale <= 1:
+            raise ValueError(f"mask_scale必须在(0, 1]范围内: {mask_scale}")
+        if mask_scale and mask_scale < 1:
+            if method not in self.methods:
+                raise ValueError(f"不支持的方法: {method}")
+            return self._process_image_scaled(image_path, output_path, method, mask_scale, kwargs)
+        
+        # 根据方法选择处理函数
+        tile_rows = kwargs.get('tile_rows')
+        if tile_rows and method not in ('threshold', 'watershed'):
+            raise ValueError(f"分块处理只支持threshold和watershed方法: {method}")
+        
+        if method == 'rembg':
+            return self.remove_background_rembg(image_path, output_path,
+                                                kwargs.get('model'), kwargs.get('model_path'))
+        elif method == 'grabcut':
+            return self.remove_background_grabcut(image_path, output_path, 
                                                 kwargs.get('iterations', 5))
+        elif method == 'grabcut_fast':
+            return self.remove_background_grabcut_fast(image_path, output_path,
+                                                     kwargs.get('iterations', 5))
         elif method == 'watershed':
-            return self.remove_background_watershed(image_path, output_path)
+            return self.remove_background_watershed(image_path, output_path, tile_rows)
         elif method == 'kmeans':
             return self.remove_background_kmeans(image_path, output_path, 
-                                               kwargs.get('k', 3))
+                                               kwargs.get('k', 3), kwargs.get('reuse_centers', False))
         elif method == 'threshold':
             return self.remove_background_threshold(image_path, output_path,
-                                                  kwargs.get('threshold_value', None))
+                                                  kwargs.get('threshold_value', None), tile_rows)
+        elif method == 'chromakey':
+            return self.remove_background_chromakey(image_path, output_path, kwargs.get('key_color'),
+                                                    kwargs.get('key_tolerance'), kwargs.get('spill', True))
         else:
             raise ValueError(f"不支持的方法: {method}")
     
-    def batch_process(self, input_dir, output_dir, method='rembg', **kwargs):
+    def batch_process(self, input_dir, output_dir, method='rembg', workers=1, cache=False,
+                      sequence=False, prefetch=None, write_threads=None, read_threads=None,
+                      recursive=False, include=None, exclude=None, **kwargs):
         """
         批量处理图片
-        """
-        if not os.path.exists(input_dir):
-            raise FileNotFoundError(f"输入目录不存在: {input_dir}")
         
-        # 获取所有支持的图片文件
-        image_files = []
-        for ext in self.supported_formats:
-            pattern = f"*{ext}"
-            image_files.extend(Path(input_dir).glob(pattern))
-            pattern = f"*{ext.upper()}"
-            image_files.extend(Path(input_dir).glob(pattern))
-        
-        if not image_files:
+        Args:
+            input_dir (str): 输入目录
+            output_dir (str): 输出目录
+            method (str): 去背景方法
+            workers (int): 并行处理的进程数，1为在当前进程中串行处理
+            cache (bool|ResultCache): 是否使用结果缓存，输入内容、方法和参数都相同时
+                直接复用上次的结果
+            sequence (bool): 帧序列模式。按frame_XXXXXX_命名识别视频转PNG输出的帧，
+                按帧顺序处理并由上一帧传播掩码（仅rembg、grabcut、grabcut_fast）
+            prefetch (int): 单进程处理时预读解码的图片数，0为不预读、读写与计算顺序进行，
+                None使用PIPELINE_PREFETCH
+            write_threads (int): 单进程处理时异步编码保存的线程数，None使用PIPELINE_WRITE_THREADS
+            read_threads (int): 单进程处理时预读解码的线程数，None使用PIPELINE_READ_THREADS
+            recursive (bool): 是否处理子目录中的图片，结果按相同的子目录结构保存
+            include (list): 通配模式，只处理文件名或相对路径匹配其中之一的图片
+            exclude (list): 通配模式，跳过文件名或相对路径匹配其中之一的图片和子目录
+            **kwargs: 方法特定参数
+        """
+        # 边扫描边处理；输出目录在输入目录内时递归扫描跳过它
+        image_files = self._find_images(input_dir, recursive, include,
+                                        exclude_output_dir(input_dir, output_dir, exclude))
+        first = next(image_files, None)
+        if first is None:
             print("未找到支持的图片文件")
             return 0
+        image_files = itertools.chain([first], image_files)
         
         # 创建输出目录
         os.makedirs(output_dir, exist_ok=True)
         
         success_count = 0
-        total_count = len(image_files)
+        total_count = 0
         
-        print(f"开始批量处理 {total_count} 张图片...")
+        print("开始批量处理图片...")
+        self._kmeans_centers = None
         
-        for i, image_file in enumerate(image_files, 1):
-            try:
-                # 生成输出文件名
-                output_filename = f"{image_file.stem}_no_bg.png"
-                output_path = os.path.join(output_dir, output_filename)
+        if sequence and method not in self.SEQUENCE_METHODS:
+            print(f"帧序列模式不支持{method}方法，按单张图片处理")
+            sequence = False
+        
+        result_cache = resolve_result_cache(cache)
+        cache_keys = {}
+        cached_count = 0
+        if result_cache is not None:
+            # 序列模式的结果依赖前面的帧，与单张处理的结果分开缓存
+            cache_params = dict(kwargs, sequence=True) if sequence else dict(kwargs)
+            if self.writer.output_mode != 'rgba':
+                cache_params['output_mode'] = self.writer.output_mode
+            if method in ('rembg', 'auto'):
+                # 未指定model时使用实例的默认模型，缓存键按实际模型区分
+                try:
+                    cache_params['rembg_model'] = self.resolve_model(kwargs.get('model'),
+                                                                     kwargs.get('model_path'))
+                except ValueError:
+                    pass
+        
+        def iter_jobs():
+            nonlocal total_count, success_count, cached_count
+            created_dirs = set()
+            for i, image_file in enumerate(image_files, 1):
+                total_count = i
+                target_dir = output_dir_for(image_file, input_dir, output_dir)
+                if target_dir not in created_dirs:
+                    os.makedirs(target_dir, exist_ok=True)
+                    created_dirs.add(target_dir)
+                image_path = str(image_file)
+                output_path = os.path.join(target_dir, f"{image_file.stem}_no_bg.png")
                 
-                # 处理图片
-                if self.process_image(str(image_file), output_path, method, **kwargs):
-                    success_count += 1
-                    print(f"[{i}/{total_count}] ✓ {image_file.name}")
+                if result_cache is not None:
+                    try:
+                        key = result_cache.make_key(image_path, f"remove_background:{method}", cache_params)
+                    except OSError:
+                        key = None
+                    if key is not None and result_cache.fetch(key, output_path):
+                        cached_count += 1
+                        success_count += 1
+                        print(f"[{i}] ✓ {image_file.name} (缓存)")
+                        continue
+                    cache_keys[i] = (key, output_path)
+                yield i, image_path, output_path
+        
+        jobs = iter_jobs()
+        
+        # 序列模式：每个目录的帧各自按序号排序后每SEQUENCE_KEYFRAME_INTERVAL帧一组，
+        # 组内依次传播掩码，各组的第一帧从头计算，因此不同的组可以并行。
+        # 递归扫描时不同子目录是不同的序列，分组不跨目录。排序需要先扫描完所有文件
+        sequence_chunks = []
+        if sequence:
+            sequences = {}
+            others = []
+            for job in jobs:
+                image_path = Path(job[1])
+                match = FRAME_NAME_PATTERN.match(image_path.name)
+                if match:
+                    sequences.setdefault(image_path.parent, []).append((int(match.group(1)), job))
                 else:
-                    print(f"[{i}/{total_count}] ✗ {image_file.name} - 处理失败")
-                
-            except Exception as e:
-                print(f"[{i}/{total_count}] ✗ {image_file.name} - 错误: {e}")
+                    others.append(job)
+            step = self.SEQUENCE_KEYFRAME_INTERVAL
+            frame_count = 0
+            for frames in sequences.values():
+                frames.sort(key=lambda item: item[0])
+                frames = [job for _, job in frames]
+                frame_count += len(frames)
+                sequence_chunks.extend((frames[k:k + step], True) for k in range(0, len(frames), step))
+            print(f"帧序列模式: 识别到 {len(sequences)} 个目录中的 {frame_count} 帧")
+            jobs = iter(others)
+        
+        # rembg按组批量推理，其他方法逐张处理
+        chunk_size = self.REMBG_BATCH_SIZE if method == 'rembg' else 1
+        chunks = itertools.chain(sequence_chunks, (
+            (chunk, False) for chunk in iter(lambda: list(itertools.islice(jobs, chunk_size)), [])
+        ))
+        
+        workers = max(1, workers or 1)
+        if workers > 1:
+            print(f"使用 {workers} 个进程并行处理")
+            results = self._iter_pool_results(chunks, method, kwargs, workers)
+        else:
+            results = self._iter_serial_results(chunks, method, kwargs, prefetch, write_threads,
+                                                read_threads)
+        
+        route_counts = {}
+        for i, image_path, success, error, route in results:
+            name = Path(image_path).name
+            if success:
+                # 只统计成功处理的图片，失败的不计入任何方法
+                route_counts[route] = route_counts.get(route, 0) + 1
+                success_count += 1
+                print(f"[{i}] ✓ {name}")
+                key, output_path = cache_keys.get(i, (None, None))
+                if key:
+                    try:
+                        result_cache.store(key, output_path)
+                    except OSError as e:
+                        print(f"警告: 无法写入结果缓存: {e}")
+            elif error:
+                print(f"[{i}] ✗ {name} - 错误: {error}")
+            else:
+                print(f"[{i}] ✗ {name} - 处理失败")
+        
+        if result_cache is not None:
+            result_cache.save_index()
         
         print(f"\n批量处理完成！成功处理 {success_count}/{total_count} 张图片")
+        if method == 'auto' and route_counts:
+            summary = ', '.join(f"{route} {count} 张" for route, count in
+                                sorted(route_counts.items(), key=lambda item: -item[1]))
+            print(f"自动选择的方法: {summary}")
+        if sequence and route_counts:
+            print(f"帧序列模式: 复用上一帧掩码 {route_counts.get('reuse', 0)} 帧，"
+                  f"由上一帧传播 {route_counts.get('propagate', 0)} 帧")
+        if cached_count:
+            print(f"其中 {cached_count} 张直接使用了缓存结果")
         return success_count
 
+    def _find_images(self, input_dir, recursive=False, include=None, exclude=None):
+        """
+        边扫描边产出目录中所有支持的图片文件（Path）
+        """
+        return scan_files(input_dir, self.supported_formats, recursive, include, exclude)
+
+    def _process_chunk(self, chunk, method, kwargs, sequence=False):
+        """
+        处理一组 (序号, 输入路径, 输出路径)
+        
+        Args:
+            sequence (bool): 这一组是按顺序排列的连续帧
+        
+        Returns:
+            list: (序号, 输入路径, 是否成功, 错误信息, 实际使用的方法) 列表
+        """
+        if sequence:
+            return self._process_sequence_chunk(chunk, method, kwargs)
+        
+        model, model_path = kwargs.get('model'), kwargs.get('model_path')
+        if method == 'rembg' and self.rembg_batch_supported(model, model_path):
+            # 走数组接口：解码一次、批量推理、单独编码
+            return self._process_rembg_chunk(chunk, model, model_path, kwargs.get('mask_scale'))
+        
+        results = []
+        for i, image_path, output_path in chunk:
+            route = method
+            try:
+                route_kwargs = kwargs
+                if method == 'auto':
+                    route, _ = self.choose_method(image_path)
+                    route_kwargs = self.auto_route_kwargs(route, kwargs)
+                success = self.process_image(image_path, output_path, route, **route_kwargs)
+                results.append((i, image_path, bool(success), None, route))
+            except Exception as e:
+                results.append((i, image_path, False, str(e), route))
+        return results
+
+    def _process_rembg_chunk(self, chunk, model=None, model_path=None, mask_scale=None):
+        """
+        读取一组图片，一次rembg批量推理，再逐张编码保存
+        """
+        kwargs = {'model': model, 'model_path': model_path}
+        loaded, results = self._read_chunk(chunk, mask_scale, 'rembg')
+        computed, results = self._compute_chunk(loaded, results, 'rembg', kwargs)
+        return self._write_chunk(computed, results, 'rembg')
+    
+    def _read_input(self, image_path, mask_scale=None):
+        """
+        读取原图，以及用于计算掩码的图像（mask_scale小于1时为缩小图，否则即原图）
+        """
+        if mask_scale is not None and not 0 < mask_scale <= 1:
+            raise ValueError(f"mask_scale必须在(0, 1]范围内: {mask_scale}")
+        if mask_scale and mask_scale < 1:
+            return self._read_scaled(image_path, mask_scale)
+        img = cv2.imread(image_path)
+        if img is None:
+            raise ValueError(f"无法读取图片: {image_path}")
+        return img, img
+    
+    def _read_chunk(self, chunk, mask_scale, method):
+        """
+        流水线读取段：解码一组图片
+        
+        Returns:
+            tuple: ([(序号, 输入路径, 输出路径, 原图, 计算用图像)], 读取失败的结果列表)
+        """
+        loaded = []
+        results = []
+        for i, image_path, output_path in chunk:
+            try:
+                img, small = self._read_input(image_path, mask_scale)
+            except ValueError as e:
+                results.append((i, image_path, False, str(e), method))
+                continue
+            loaded.append((i, image_path, output_path, img, small))
+        return loaded, results
+    
+    def _compute_chunk(self, loaded, results, method, kwargs):
+        """
+        流水线计算段：计算一组图片的掩码，rembg整组一次批量推理
+        
+        Returns:
+            tuple: ([(序号, 输入路径, 输出路径, 原图, 掩码)], 结果列表)
+        """
+        computed = []
+        if not loaded:
+            return computed, results
+        
+        if method == 'rembg':
+            try:
+                masks = self.predict_rembg_masks([small for *_, small in loaded], model=kwargs.get('model'),
+                                                 model_path=kwargs.get('model_path'))
+            except Exception as e:
+                results.extend((i, image_path, False, f"rembg处理失败: {e}", method)
+                               for i, image_path, *_ in loaded)
+                return computed, results
+            computed.extend((i, image_path, output_path, img, mask)
+                            for (i, image_path, output_path, img, _), mask in zip(loaded, masks))
+            return computed, results
+        
+        for i, image_path, output_path, img, small in loaded:
+            try:
+                img, mask = self._compute_scaled(img, small, method, kwargs)
+            except Exception as e:
+                results.append((i, image_path, False, str(e), method))
+                continue
+            computed.append((i, image_path, output_path, img, mask))
+        return computed, results
+    
+    def _write_chunk(self, computed, results, method, reuse_buffer=True):
+        """
+        流水线写出段：缩小图上的掩码保边放大后合成、编码保存
+        
+        Returns:
+            list: (序号, 输入路径, 是否成功, 错误信息, 实际使用的方法) 列表
+        """
+        for i, image_path, output_path, img, mask in computed:
+            try:
+                if mask.shape != img.shape[:2]:
+                    mask = guided_upsample_mask(mask, img)
+                success = self.writer.write(output_path, img, mask, reuse_buffer)
+                results.append((i, image_path, bool(success), None, method))
+            except Exception as e:
+                results.append((i, image_path, False, str(e), method))
+        return results
+    
+    def _iter_serial_results(self, chunks, method, kwargs, prefetch=None, write_threads=None,
+                             read_threads=None):
+        """
+        在当前进程中处理各组图片，逐条产出结果
+        
+        普通的组交给读取/计算/写出三段流水线：读取线程预读解码后面的图片，
+        写出线程异步编码保存，读写网络共享盘时计算不必等待IO。自动选择方法、
+        分条带处理和不支持数组推理的rembg模型仍逐张调用process_image。
+        """
+        # 帧序列的组排在最前面，依次处理后余下的都是普通的组
+        chunks = iter(chunks)
+        for chunk, in_sequence in chunks:
+            if not in_sequence:
+                chunks = itertools.chain([(chunk, in_sequence)], chunks)
+                break
+            yield from self._process_chunk(chunk, method, kwargs, True)
+        plain = (chunk for chunk, _ in chunks)
+        
+        if not self._pipeline_supported(method, kwargs):
+            for chunk in plain:
+                yield from self._process_chunk(chunk, method, kwargs)
+            return
+        
+        if prefetch is None:
+            prefetch = self.PIPELINE_PREFETCH
+        if write_threads is None:
+            write_threads = self.PIPELINE_WRITE_THREADS
+        if read_threads is None:
+            read_threads = self.PIPELINE_READ_THREADS
+        
+        # 预读和写出队列按组计数，rembg每组有多张图片
+        chunk_size = self.REMBG_BATCH_SIZE if method == 'rembg' else 1
+        mask_scale = kwargs.get('mask_scale')
+        pipeline = StagedPipeline(
+            read=lambda chunk: self._read_chunk(chunk, mask_scale, method),
+            compute=lambda chunk, data: self._compute_chunk(*data, method, kwargs),
+            write=lambda chunk, data: self._write_chunk(*data, method, reuse_buffer=False),
+            read_threads=read_threads,
+            prefetch=-(-prefetch // chunk_size),
+            write_threads=write_threads,
+            write_queue=max(1, write_threads * 2 // chunk_size),
+        )
+        for chunk, results, error in pipeline.run(plain):
+            if error is not None:
+                yield from ((i, image_path, False, str(error), method) for i, image_path, _ in chunk)
+            else:
+                yield from results
+    
+    def _pipeline_supported(self, method, kwargs):
+        """
+        method和参数能否拆成读取/计算/写出三段处理
+        """
+        if method not in self.methods or kwargs.get('tile_rows'):
+            return False
+        if method == 'rembg':
+            return self.rembg_batch_supported(kwargs.get('model'), kwargs.get('model_path'))
+        return True
+    
+    def _process_sequence_chunk(self, chunk, method, kwargs):
+        """
+        按帧顺序处理一段连续帧，由上一帧传播掩码
+        
+        每帧先与上一帧比较：用相位相关估计全局平移，对齐后几乎没有变化的帧
+        直接平移复用上一帧的掩码，不再推理；变化较大时grabcut类方法以平移后的
+        上一帧掩码为初值，只在边界带内少量迭代。第一帧、镜头切换以及传播
+        失败的帧按原方法从头计算。
+        
+        Returns:
+            list: (序号, 输入路径, 是否成功, 错误信息, 处理方式) 列表，
+                处理方式为'reuse'（复用）、'propagate'（传播）或方法名
+        """
+        mask_scale = kwargs.get('mask_scale')
+        iterations = min(kwargs.get('iterations', 5), self.SEQUENCE_GRABCUT_ITERATIONS)
+        results = []
+        prev_thumb = prev_mask = None
+        for i, image_path, output_path in chunk:
+            try:
+                img, small = self._read_input(image_path, mask_scale)
+                thumb = cv2.cvtColor(self._thumbnail(img), cv2.COLOR_BGR2GRAY).astype(np.float32)
+                
+                route = method
+                mask = None
+                if prev_mask is not None and prev_thumb.shape == thumb.shape:
+                    (dx, dy), changed, mean_diff = self._compare_frames(prev_thumb, thumb)
+                    if mean_diff <= self.SEQUENCE_CUT_DIFF:
+                        scale = small.shape[1] / thumb.shape[1]
+                        shifted = self._shift_mask(prev_mask, dx * scale, dy * scale)
+                        if changed <= self.SEQUENCE_REUSE_RATIO:
+                            mask, route = shifted, 'reuse'
+                        elif method != 'rembg':
+                            fg = self._refine_band(small, (shifted > 127).astype(np.uint8),
+                                                   self.SEQUENCE_BAND_RADIUS, iterations)
+                            if fg.any():
+                                mask, route = fg * 255, 'propagate'
+                
+                if mask is None:
+                    mask = self.compute_mask(small, method, **kwargs)
+                prev_thumb, prev_mask = thumb, mask
+                
+                if mask.shape != img.shape[:2]:
+                    mask = guided_upsample_mask(mask, img)
+                success = self.writer.write(output_path, img, mask)
+                results.append((i, image_path, bool(success), None, route))
+            except Exception as e:
+                # 出错的帧之后从头计算
+                prev_thumb = prev_mask = None
+                results.append((i, image_path, False, str(e), method))
+        return results
+    
+    def _compare_frames(self, prev, current):
+        """
+        比较相邻两帧的灰度缩略图
+        
+        Returns:
+            tuple: ((dx, dy) 当前帧相对上一帧的平移, 对齐后有变化的像素比例, 平均灰度差)
+        """
+        mean_diff = float(cv2.absdiff(prev, current).mean())
+        (dx, dy), _ = cv2.phaseCorrelate(prev, current)
+        if abs(dx) < 0.5 and abs(dy) < 0.5:
+            dx = dy = 0.0
+            aligned = prev
+        else:
+            height, width = prev.shape
+            shift = np.float32([[1, 0, dx], [0, 1, dy]])
+            aligned = cv2.warpAffine(prev, shift, (width, height), borderMode=cv2.BORDER_REPLICATE)
+        changed = np.count_nonzero(cv2.absdiff(aligned, current) > self.SEQUENCE_PIXEL_TOLERANCE)
+        return (dx, dy), changed / current.size, mean_diff
+    
+    @staticmethod
+    def _shift_mask(mask, dx, dy):
+        """
+        按 (dx, dy) 平移掩码，移出画面的部分补0
+        """
+        if dx == 0 and dy == 0:
+            return mask
+        height, width = mask.shape
+        shift = np.float32([[1, 0, dx], [0, 1, dy]])
+        return cv2.warpAffine(mask, shift, (width, height), flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    
+    def _iter_pool_results(self, chunks, method, kwargs, workers):
+        """
+        用进程池处理各组图片，按完成顺序逐条产出结果
+        
+        每个进程只创建一次自己的BackgroundRemover并复用，ONNX算子线程数
+        按CPU核数平均分给各进程，避免多个会话抢占同一批核心。各组边扫描边提交，
+        未完成的组不超过进程数的两倍。
+        """
+        onnx_threads = max(1, (os.cpu_count() or 1) // workers)
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_batch_worker_init,
+                                       initargs=(onnx_threads, {
+                                           'model': self.rembg_model,
+                                           'model_path': self.rembg_model_path,
+                                           'output_mode': self.writer.output_mode,
+                                       }))
+        try:
+            futures = set()
+            for chunk, sequence in chunks:
+                if len(futures) >= workers * 2:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+                futures.add(executor.submit(_batch_worker_task, chunk, method, kwargs, sequence))
+            for future in as_completed(futures):
+                yield from future.result()
+        except KeyboardInterrupt:
+            print("\n用户中断操作")
+            executor.shutdown(wait=False, cancel_futures=True)
+        finally:
+            executor.shutdown(wait=True)
+
+    def benchmark_models(self, sample_dir, models=None, reference='u2net', limit=50):
+        """
+        在样本图片上对比rembg模型的速度与效果，用于按素材类型选择模型
+        
+        速度为批量推理的每秒图片数（不含模型加载）；一致性为与参考模型掩码的
+        平均IoU（按128二值化）以及alpha平均绝对误差（0-255）。
+        
+        Args:
+            sample_dir (str): 样本图片目录
+            models (list): 要测试的模型名或.onnx文件路径，None测试全部内置模型
+            reference (str): 作为效果基准的模型
+            limit (int): 最多使用的样本图片数
+            
+        Returns:
+            list: 每个模型一条结果 {'model', 'images_per_sec', 'iou', 'alpha_mae'}
+        """
+        images = []
+        for image_file in sorted(self._find_images(sample_dir))[:limit]:
+            img = cv2.imread(str(image_file))
+            if img is not None:
+                images.append(img)
+        
+        if not images:
+            print("未找到可用的样本图片")
+            return []
+        
+        models = list(models or [name for name, _ in REMBG_MODELS])
+        if reference not in models:
+            models.insert(0, reference)
+        
+        print(f"基准测试: {len(images)} 张样本图片，参考模型: {reference}")
+        
+        results = []
+        reference_masks = None
+        for model in models:
+            try:
+                supported = self.rembg_batch_supported(model)
+            except ValueError as e:
+                print(f"  {model}: {e}，跳过")
+                continue
+            if not supported:
+                print(f"  {model}: 模型不可用，跳过")
+                continue
+            
+            # 预热一次，排除会话初始化的开销
+            self.predict_rembg_masks(images[:1], model=model)
+            start = time.perf_counter()
+            masks = self.predict_rembg_masks(images, model=model)
+            elapsed = time.perf_counter() - start
+            
+            if model == reference:
+                reference_masks = masks
+            results.append({
+                'model': model,
+                'images_per_sec': len(images) / elapsed if elapsed > 0 else float('inf'),
+                'masks': masks,
+            })
+        
+        for result in results:
+            masks = result.pop('masks')
+            result['iou'] = None
+            result['alpha_mae'] = None
+            if reference_masks is None:
+                continue
+            
+            ious = []
+            maes = []
+            for mask, reference_mask in zip(masks, reference_masks):
+                fg = mask >= 128
+                reference_fg = reference_mask >= 128
+                union = np.count_nonzero(fg | reference_fg)
+                ious.append(np.count_nonzero(fg & reference_fg) / union if union else 1.0)
+                maes.append(float(np.mean(cv2.absdiff(mask, reference_mask))))
+            result['iou'] = float(np.mean(ious))
+            result['alpha_mae'] = float(np.mean(maes))
+        
+        print(f"\n{'模型':<24}{'图片/秒':>10}{'IoU':>10}{'Alpha误差':>12}")
+        for result in results:
+            iou = f"{result['iou']:.4f}" if result['iou'] is not None else '-'
+            mae = f"{result['alpha_mae']:.2f}" if result['alpha_mae'] is not None else '-'
+            name = os.path.basename(result['model'])
+            print(f"{name:<24}{result['images_per_sec']:>10.2f}{iou:>10}{mae:>12}")
+        
+        return results
+
     def process_batch(self, input_path, method='rembg', **kwargs):
         """
         批量处理接口（GUI专用）
@@ -333,25 +2010,116 @@ class BackgroundRemover:
         return self.batch_process(input_path, str(output_dir), method, **kwargs)
 
 
+def parse_key_color(text):
+    """
+    解析抠像颜色：'#RRGGBB' 或 'R,G,B'，返回OpenCV顺序的 (B, G, R)
+    """
+    text = text.strip()
+    if text.startswith('#') and len(text) == 7:
+        r, g, b = (int(text[i:i + 2], 16) for i in (1, 3, 5))
+    else:
+        parts = [int(v) for v in text.split(',')]
+        if len(parts) != 3:
+            raise ValueError(f"无法解析颜色: {text}")
+        r, g, b = parts
+    return b, g, r
+
+
+# 进程池中每个工作进程各自持有的去背景实例
+_worker_remover = None
+_worker_onnx_threads = None
+_worker_options = {}
+
+
+def _batch_worker_init(onnx_threads, options=None):
+    """
+    工作进程初始化：限制本进程的计算线程数
+    
+    Args:
+        options (dict): 创建BackgroundRemover的其他参数（默认模型、模型路径、输出模式），
+            与主进程的实例保持一致
+    """
+    global _worker_onnx_threads, _worker_options
+    _worker_onnx_threads = onnx_threads
+    _worker_options = options or {}
+    os.environ['OMP_NUM_THREADS'] = str(onnx_threads)
+    cv2.setNumThreads(onnx_threads)
+
+
+def _batch_worker_task(chunk, method, kwargs, sequence=False):
+    """工作进程入口：首次调用时创建BackgroundRemover，之后复用同一个模型会话"""
+    global _worker_remover
+    if _worker_remover is None:
+        _worker_remover = BackgroundRemover(onnx_threads=_worker_onnx_threads, **_worker_options)
+    return _worker_remover._process_chunk(chunk, method, kwargs, sequence)
+
+
 def main():
     parser = argparse.ArgumentParser(description='自动去背景转PNG工具')
     parser.add_argument('input', help='输入图片文件或目录路径')
     parser.add_argument('-o', '--output', help='输出文件或目录路径')
-    parser.add_argument('-m', '--method', choices=['rembg', 'grabcut', 'watershed', 'kmeans', 'threshold'],
-                       default='rembg', help='去背景方法 (默认: rembg)')
+    parser.add_argument('-m', '--method', choices=['rembg', 'grabcut', 'grabcut_fast', 'watershed', 'kmeans', 'threshold', 'chromakey', 'auto'],
+                       default='rembg', help='去背景方法 (默认: rembg, auto=先分析图片自动选择)')
     parser.add_argument('--batch', action='store_true', help='批量处理目录中的所有图片')
+    parser.add_argument('--model', help='rembg模型: ' + ', '.join(name for name, _ in REMBG_MODELS)
+                       + ' 或自定义(如int8量化)的.onnx文件路径 (默认: u2net)')
+    parser.add_argument('--benchmark', action='store_true',
+                       help='在输入目录的样本图片上对比rembg模型的速度和与u2net的掩码一致性')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='批量处理的并行进程数 (默认: 1)')
+    parser.add_argument('--cache', action='store_true',
+                       help='批量处理时使用结果缓存，输入内容和参数都未变的图片直接复用上次结果')
+    parser.add_argument('--cache-size', type=int, default=2048, help='结果缓存大小上限(MB) (默认: 2048)')
+    parser.add_argument('--prefetch', type=int,
+                       help='单进程批量处理时预读解码的图片数, 0为关闭流水线 (默认: 4)')
+    parser.add_argument('--write-threads', type=int, help='单进程批量处理时异步编码保存的线程数 (默认: 2)')
+    parser.add_argument('--read-threads', type=int, help='单进程批量处理时预读解码的线程数 (默认: 2)')
+    parser.add_argument('-r', '--recursive', action='store_true', help='批量处理时包含子目录中的图片')
+    parser.add_argument('--include', action='append',
+                       help='批量处理时只处理匹配该通配模式的文件 (匹配文件名或相对路径, 可多次指定)')
+    parser.add_argument('--exclude', action='append',
+                       help='批量处理时跳过匹配该通配模式的文件和子目录 (可多次指定)')
+    parser.add_argument('--sequence', action='store_true',
+                       help='批量处理视频转PNG的帧序列时由上一帧传播掩码 (rembg/grabcut/grabcut_fast)')
     
     # 方法特定参数
-    parser.add_argument('--iterations', type=int, default=5, help='GrabCut迭代次数')
+    parser.add_argument('--iterations', type=int, default=5, help='GrabCut迭代次数 (grabcut_fast为每层最多迭代次数)')
     parser.add_argument('--k', type=int, default=3, help='K-means聚类数量')
+    parser.add_argument('--reuse-centers', action='store_true',
+                       help='批量K-means时以上一张图片的聚类中心为初值 (适合颜色相近的图片)')
     parser.add_argument('--threshold', type=int, help='阈值方法的阈值')
+    parser.add_argument('--key-color', help='抠像幕布颜色, 如 #00FF00 (默认: 由边框自动估计)')
+    parser.add_argument('--key-tolerance', type=float, nargs=2, metavar=('INNER', 'OUTER'),
+                       help='抠像色度距离阈值, 小于INNER全透明, 大于OUTER不透明 (默认: 18 40)')
+    parser.add_argument('--no-spill', action='store_true', help='抠像时不做溢色抑制')
+    parser.add_argument('--rate', type=float, help='输入为视频时的抠像帧率 (默认: 每一帧)')
+    parser.add_argument('--tile-rows', type=int,
+                       help='threshold/watershed分条带处理的条带行数, 用于内存放不下的超大图 (例如1024)')
+    parser.add_argument('--output-mode', choices=MaskWriter.OUTPUT_MODES, default='rgba',
+                       help='输出内容: rgba=透明PNG, mask=只输出灰度掩码, premultiplied=颜色预乘alpha (默认: rgba)')
+    parser.add_argument('--mask-scale', type=float,
+                       help='在缩小图上计算掩码再保边放大 (0-1, 例如0.25; 0.5/0.25/0.125对JPEG可直接缩小解码)')
     
     args = parser.parse_args()
     
-    remover = BackgroundRemover()
+    remover = BackgroundRemover(output_mode=args.output_mode)
     
     try:
-        if args.batch:
+        key_color = parse_key_color(args.key_color) if args.key_color else None
+        video_formats = ['.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm']
+        
+        if args.benchmark:
+            results = remover.benchmark_models(args.input, models=[args.model] if args.model else None)
+            if not results:
+                sys.exit(1)
+        elif args.method == 'chromakey' and Path(args.input).suffix.lower() in video_formats:
+            # 视频直接逐帧抠像
+            output_dir = args.output or f"{Path(args.input).stem}_keyed"
+            saved_count = remover.chromakey_video(args.input, output_dir, frame_rate=args.rate,
+                                                  key_color=key_color, tolerance=args.key_tolerance,
+                                                  spill=not args.no_spill)
+            if saved_count == 0:
+                sys.exit(1)
+        elif args.batch:
             # 批量处理
             if not args.output:
                 args.output = "output_no_bg"
@@ -360,9 +2128,25 @@ def main():
                 input_dir=args.input,
                 output_dir=args.output,
                 method=args.method,
+                workers=args.workers,
+                cache=ResultCache(max_bytes=args.cache_size * 1024 * 1024) if args.cache else False,
+                sequence=args.sequence,
+                recursive=args.recursive,
+                include=args.include,
+                exclude=args.exclude,
+                prefetch=args.prefetch,
+                write_threads=args.write_threads,
+                read_threads=args.read_threads,
+                model=args.model,
                 iterations=args.iterations,
                 k=args.k,
-                threshold_value=args.threshold
+                reuse_centers=args.reuse_centers,
+                threshold_value=args.threshold,
+                tile_rows=args.tile_rows,
+                key_color=key_color,
+                key_tolerance=args.key_tolerance,
+                spill=not args.no_spill,
+                mask_scale=args.mask_scale
             )
             
             if success_count > 0:
@@ -374,15 +2158,28 @@ def main():
                 args.output = f"{input_path.stem}_no_bg.png"
             
             print(f"正在处理图片: {args.input}")
-            print(f"使用方法: {args.method}")
+            tile_rows = args.tile_rows
+            if args.method == 'auto':
+                args.method, reason = remover.choose_method(args.input)
+                print(f"自动选择方法: {args.method} ({reason})")
+                tile_rows = remover.auto_route_kwargs(args.method, {'tile_rows': tile_rows})['tile_rows']
+            else:
+                print(f"使用方法: {args.method}")
             
             success = remover.process_image(
                 image_path=args.input,
                 output_path=args.output,
                 method=args.method,
+                model=args.model,
                 iterations=args.iterations,
                 k=args.k,
-                threshold_value=args.threshold
+                reuse_centers=args.reuse_centers,
+                threshold_value=args.threshold,
+                tile_rows=tile_rows,
+                key_color=key_color,
+                key_tolerance=args.key_tolerance,
+                spill=not args.no_spill,
+                mask_scale=args.mask_scale
             )
             
             if success:
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+处理结果缓存
+以输入文件内容的哈希、处理方法及其参数为键，把处理结果保存在本地磁盘，
+重复处理未变化的素材库时直接复用之前的结果
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+
+# 处理逻辑变化导致旧结果失效时递增
+CACHE_VERSION = 1
+
+
+def default_cache_dir():
+    """工具缓存目录，可通过环境变量GAMEASSETTOOL_CACHE_DIR指定"""
+    cache_dir = os.environ.get('GAMEASSETTOOL_CACHE_DIR')
+    if cache_dir:
+        return cache_dir
+    base_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base_dir, 'gameassettool')
+
+
+def write_json_atomic(path, data):
+    """先写临时文件再替换，避免中断时留下半个JSON"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class ResultCache:
+    """
+    内容寻址的处理结果缓存
+
+    结果文件按键的哈希值存放在缓存目录下，总大小超过上限时按最近使用时间
+    （文件修改时间）淘汰最久未用的结果。输入文件的哈希按 (路径, 大小, 修改时间)
+    记录在索引中，文件未变化时不必重新读取计算。
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=2 * 1024 ** 3, link=False, max_index_entries=200000):
+        """
+        Args:
+            cache_dir (str): 缓存目录，None使用默认缓存目录下的results
+            max_bytes (int): 缓存结果的总大小上限（字节）
+            link (bool): 命中时用硬链接代替复制。链接与缓存共用同一份文件，
+                之后若原地改写输出文件会一并改动缓存内容
+            max_index_entries (int): 输入文件哈希索引的最大条目数
+        """
+        self.cache_dir = cache_dir or os.path.join(default_cache_dir(), 'results')
+        self.max_bytes = max_bytes
+        self.link = link
+        self.max_index_entries = max_index_entries
+        self._index_path = os.path.join(self.cache_dir, 'hash_index.json')
+        self._hash_index = None
+        self._index_dirty = False
+        self._total_bytes = None
+
+    def make_key(self, input_path, method, params=None):
+        """
+        计算缓存键
+
+        Args:
+            input_path (str): 输入文件路径
+            method (str): 处理方法名
+            params (dict): 影响结果的参数
+
+        Returns:
+            str: 十六进制缓存键
+        """
+        description = json.dumps({
+            'version': CACHE_VERSION,
+            'method': method,
+            'params': params or {},
+        }, sort_keys=True, default=str)
+        digest = hashlib.sha256(self._file_hash(input_path).encode('ascii'))
+        digest.update(description.encode('utf-8'))
+        return digest.hexdigest()
+
+    def fetch(self, key, output_path):
+        """
+        缓存命中时把结果放到output_path
+
+        Returns:
+            bool: 是否命中
+        """
+        entry_path = self._entry_path(key)
+        if not os.path.exists(entry_path):
+            return False
+
+        try:
+            if os.path.exists(output_path):
+                if self.link and os.path.samefile(entry_path, output_path):
+                    os.utime(entry_path)
+                    return True
+                os.remove(output_path)
+
+            linked = False
+            if self.link:
+                try:
+                    os.link(entry_path, output_path)
+                    linked = True
+                except OSError:
+                    pass
+            if not linked:
+                shutil.copyfile(entry_path, output_path)
+
+            # 以修改时间记录最近使用时间，供淘汰时参考
+            os.utime(entry_path)
+            return True
+        except OSError:
+            return False
+
+    def store(self, key, result_path):
+        """
+        把处理结果存入缓存，超出大小上限时淘汰最久未用的结果
+        """
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        shutil.copyfile(result_path, tmp_path)
+        os.replace(tmp_path, entry_path)
+
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, size, _ in self._scan_entries())
+        else:
+            self._total_bytes += os.path.getsize(entry_path)
+
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self, target_bytes=None):
+        """
+        按最近使用时间淘汰结果，直到总大小不超过target_bytes（默认上限的90%）
+        """
+        if target_bytes is None:
+            target_bytes = self.max_bytes * 0.9
+
+        entries = sorted(self._scan_entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= target_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
+
+    def save_index(self):
+        """
+        保存输入文件哈希索引（批量处理结束时调用）
+        """
+        if not self._index_dirty:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        index = self._hash_index
+        if len(index) > self.max_index_entries:
+            # 丢弃最早记录的条目
+            for path in list(index)[:len(index) - self.max_index_entries]:
+                del index[path]
+        try:
+            write_json_atomic(self._index_path, index)
+            self._index_dirty = False
+        except OSError as e:
+            print(f"警告: 无法保存缓存索引: {e}")
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, 'entries', key[:2], key)
+
+    def _scan_entries(self):
+        """
+        列出所有缓存结果 (修改时间, 大小, 路径)
+        """
+        entries = []
+        for root, _, files in os.walk(os.path.join(self.cache_dir, 'entries')):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _file_hash(self, path):
+        """
+        输入文件内容的SHA-256，文件大小和修改时间未变时直接使用索引中的值
+        """
+        if self._hash_index is None:
+            self._hash_index = read_json(self._index_path) or {}
+
+        abs_path = os.path.abspath(path)
+        stat = os.stat(abs_path)
+        entry = self._hash_index.get(abs_path)
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+            return entry['sha256']
+
+        digest = hashlib.sha256()
+        with open(abs_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+
+        self._hash_index[abs_path] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': sha256,
+        }
+        self._index_dirty = True
+        return sha256
+
+
+def resolve_result_cache(cache):
+    """
+    把批量接口的cache参数转换为ResultCache实例
+
+    Args:
+        cache: False/None不使用缓存，True使用默认缓存，或直接传入ResultCache实例
+    """
+    if not cache:
+        return None
+    if isinstance(cache, ResultCache):
+        return cache
+    return ResultCache()
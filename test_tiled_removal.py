@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试分条带去背景（--tile-rows）与整图处理的结果一致
+"""
+
+import os
+import tempfile
+
+import cv2
+import numpy as np
+from remove_background import BackgroundRemover
+
+
+def create_test_image(path):
+    """创建一张浅色背景上带一个超过光晕的大椭圆和一个小圆的测试图"""
+    img = np.full((2000, 1500, 3), 230, np.uint8)
+    # 大物体：高1800行，远大于默认128行的光晕
+    cv2.ellipse(img, (750, 1000), (600, 900), 0, 0, 360, (40, 60, 80), -1)
+    cv2.circle(img, (100, 100), 30, (20, 20, 20), -1)
+    cv2.imwrite(path, img)
+
+
+def compare_tiled(remover, method, image_path, temp_dir, tile_rows=256):
+    """分别整图和分条带处理，返回 (不一致的像素数, 整图前景像素数, 分条带前景像素数)"""
+    full_path = os.path.join(temp_dir, f'{method}_full.png')
+    tiled_path = os.path.join(temp_dir, f'{method}_tiled.png')
+    remover.process_image(image_path, full_path, method)
+    remover.process_image(image_path, tiled_path, method, tile_rows=tile_rows)
+
+    full = cv2.imread(full_path, cv2.IMREAD_UNCHANGED)[:, :, 3]
+    tiled = cv2.imread(tiled_path, cv2.IMREAD_UNCHANGED)[:, :, 3]
+    return int(np.count_nonzero(full != tiled)), int(np.count_nonzero(full)), int(np.count_nonzero(tiled))
+
+
+def test_tiled_removal():
+    """测试threshold和watershed分条带处理与整图逐像素一致"""
+    remover = BackgroundRemover()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        image_path = os.path.join(temp_dir, 'large_object.png')
+        create_test_image(image_path)
+
+        for method in ('threshold', 'watershed'):
+            diff, full_count, tiled_count = compare_tiled(remover, method, image_path, temp_dir)
+            print(f"{method}: 不一致像素 {diff}，前景像素 整图 {full_count} / 分条带 {tiled_count}")
+            assert diff == 0, f"{method}分条带处理结果与整图不一致"
+
+    print("\n✓ 测试完成")
+
+
+if __name__ == "__main__":
+    test_tiled_removal()
@@ -6,17 +6,378 @@
 """
 
 import cv2
+import numpy as np
 import os
 import argparse
+import csv
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import sys
 
+from image_resizer import ImageResizer
+from result_cache import default_cache_dir, write_json_atomic, read_json
+
+
+def default_encode_threads():
+    """默认的PNG编码线程数（按CPU核数，最多8个）"""
+    return max(1, min(8, os.cpu_count() or 1))
+
+
+class FrameWriterPool:
+    """
+    PNG编码/写盘线程池
+
+    解码线程通过有界队列提交帧，队列满时submit会阻塞（背压），
+    因此内存中等待编码的帧数始终不超过队列长度。
+    cv2.imwrite在编码期间释放GIL，多个写线程可以并行利用多核。
+    """
+
+    def __init__(self, num_threads, quality, queue_size=None, on_saved=None):
+        self.quality = quality
+        self.on_saved = on_saved
+        self.saved_count = 0
+        self.error = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size or num_threads * 2)
+        self._threads = [
+            threading.Thread(target=self._worker, daemon=True)
+            for _ in range(num_threads)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _worker(self):
+        params = [cv2.IMWRITE_PNG_COMPRESSION, self.quality]
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            output_path, frame, key = item
+            try:
+                if not cv2.imwrite(output_path, frame, params):
+                    raise IOError(f"写入图片失败: {output_path}")
+                with self._lock:
+                    self.saved_count += 1
+                if self.on_saved:
+                    self.on_saved(key)
+            except Exception as e:
+                # 记录第一个错误，后续帧照常消费以免解码线程阻塞
+                with self._lock:
+                    if self.error is None:
+                        self.error = e
+
+    def submit(self, output_path, frame, key=None):
+        """提交一帧，队列已满时阻塞；写线程出错时抛出该错误。写完后以key回调on_saved"""
+        if self.error is not None:
+            raise self.error
+        self._queue.put((output_path, frame, key))
+
+    def close(self):
+        """等待已提交的帧全部写完并结束线程"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+class VideoInfoCache:
+    """
+    视频信息的磁盘缓存
+
+    以绝对路径为键，文件大小和修改时间都未变化时直接返回上次的探测结果。
+    缓存写入失败不会影响探测本身。
+    """
+
+    def __init__(self, cache_path=None, max_entries=1000):
+        self.cache_path = cache_path or os.path.join(default_cache_dir(), 'video_info.json')
+        self.max_entries = max_entries
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        entries = read_json(self.cache_path)
+        return entries if isinstance(entries, dict) else {}
+
+    def _key(self, video_path):
+        path = os.path.abspath(video_path)
+        stat = os.stat(path)
+        return path, stat.st_size, stat.st_mtime_ns
+
+    def get(self, video_path, probe='fast'):
+        """查找指定探测级别(fast/full)的缓存结果"""
+        try:
+            path, size, mtime_ns = self._key(video_path)
+        except OSError:
+            return None
+
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            entry = self._entries.get(path)
+
+        if not entry or entry.get('size') != size or entry.get('mtime_ns') != mtime_ns:
+            return None
+        return entry.get('probes', {}).get(probe)
+
+    def put(self, video_path, probe, info):
+        """写入缓存（合并磁盘上其他进程写入的条目）"""
+        try:
+            path, size, mtime_ns = self._key(video_path)
+        except OSError:
+            return
+
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(path)
+            if not entry or entry.get('size') != size or entry.get('mtime_ns') != mtime_ns:
+                entry = {'size': size, 'mtime_ns': mtime_ns, 'probes': {}}
+            entry['probes'][probe] = info
+            entry['cached_at'] = time.time()
+            entries[path] = entry
+
+            # 超出容量时淘汰最早写入的条目
+            if len(entries) > self.max_entries:
+                oldest = sorted(entries, key=lambda k: entries[k].get('cached_at', 0))
+                for key in oldest[:len(entries) - self.max_entries]:
+                    del entries[key]
+            self._entries = entries
+
+            try:
+                os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+                write_json_atomic(self.cache_path, entries)
+            except OSError:
+                pass
+
+
+class ExtractionManifest:
+    """
+    断点续传清单
+
+    主清单 output_dir/.extract_manifest.json 记录提取参数、已完成的帧号，
+    以及去重时被跳过的帧（帧号 -> 代表它的保留帧号）。
+    每个提取进程把自己的进度写入单独的分片文件，定期落盘，
+    结束时（或下次启动时）再合并进主清单，多进程提取之间互不覆盖。
+    """
+
+    FILENAME = '.extract_manifest.json'
+    PART_PREFIX = '.extract_manifest.'
+    PART_SUFFIX = '.part.json'
+
+    def __init__(self, output_dir, params, flush_interval=2.0):
+        self.params = params
+        self.flush_interval = flush_interval
+        self.path = os.path.join(output_dir, f"{self.PART_PREFIX}{os.getpid()}{self.PART_SUFFIX}")
+        self._completed = []
+        self._duplicates = []
+        self._dirty = False
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+
+    def mark_done(self, frame_index):
+        """记录一帧已写完（线程安全）"""
+        with self._lock:
+            self._completed.append(frame_index)
+            self._changed_locked()
+
+    def mark_duplicate(self, frame_index, kept_index):
+        """记录一帧因与保留帧kept_index重复而被跳过"""
+        with self._lock:
+            self._duplicates.append([frame_index, kept_index])
+            self._changed_locked()
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self._flush_locked()
+
+    def _changed_locked(self):
+        self._dirty = True
+        if time.time() - self._last_flush >= self.flush_interval:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        try:
+            write_json_atomic(self.path, {
+                'params': self.params,
+                'completed': self._completed,
+                'duplicates': self._duplicates,
+            })
+        except OSError:
+            pass
+        self._dirty = False
+        self._last_flush = time.time()
+
+    @classmethod
+    def _part_paths(cls, output_dir):
+        try:
+            names = os.listdir(output_dir)
+        except OSError:
+            return []
+        return [
+            os.path.join(output_dir, name) for name in names
+            if name.startswith(cls.PART_PREFIX) and name.endswith(cls.PART_SUFFIX)
+        ]
+
+    @staticmethod
+    def empty_state():
+        return {'completed': [], 'duplicates': {}}
+
+    @classmethod
+    def merge(cls, output_dir, params, state=None):
+        """
+        把分片合并进主清单并返回进度
+
+        参数与清单记录不一致时视为新任务，旧记录被丢弃。
+        state不为None时直接用它重写主清单。
+
+        Returns:
+            dict: {'completed': 按完成顺序的帧号列表, 'duplicates': {帧号: 保留帧号}}
+        """
+        main_path = os.path.join(output_dir, cls.FILENAME)
+        part_paths = cls._part_paths(output_dir)
+
+        if state is None:
+            state = cls.empty_state()
+            seen = set()
+            for path in [main_path] + part_paths:
+                data = read_json(path)
+                if not data or data.get('params') != params:
+                    continue
+                for frame_index in data.get('completed', []):
+                    if frame_index not in seen:
+                        seen.add(frame_index)
+                        state['completed'].append(frame_index)
+                for frame_index, kept_index in data.get('duplicates', []):
+                    state['duplicates'][frame_index] = kept_index
+
+        write_json_atomic(main_path, {
+            'params': params,
+            'completed': list(state['completed']),
+            'duplicates': sorted([k, v] for k, v in state['duplicates'].items()),
+        })
+        for path in part_paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return state
+
+
+class FrameDeduplicator:
+    """
+    近似重复帧过滤
+
+    每帧缩小到32x32灰度图后与上一张保留帧比较平均绝对差（0-255），
+    不超过阈值的帧视为重复。缩略图计算只占解码开销的很小一部分。
+    """
+
+    THUMB_SIZE = 32
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.kept_index = None
+        self._kept_thumb = None
+
+    def check(self, frame_index, frame):
+        """重复时返回代表它的保留帧号，否则把该帧设为新的保留帧并返回None"""
+        thumb = cv2.resize(frame, (self.THUMB_SIZE, self.THUMB_SIZE), interpolation=cv2.INTER_AREA)
+        if thumb.ndim == 3:
+            thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+        thumb = thumb.astype(np.int16)
+
+        if self._kept_thumb is not None and np.abs(thumb - self._kept_thumb).mean() <= self.threshold:
+            return self.kept_index
+
+        self._kept_thumb = thumb
+        self.kept_index = frame_index
+        return None
+
+
+class SceneDetector:
+    """
+    镜头切换检测
+
+    每帧缩小到宽64像素的灰度图，与前一个采样帧比较平均绝对差（0-255），
+    超过阈值即视为新镜头的第一帧。接口与FrameDeduplicator一致：
+    新镜头返回None（需要保存），否则返回所属镜头的起始帧号。
+    """
+
+    THUMB_WIDTH = 64
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.scene_start = None
+        self._prev_thumb = None
+
+    def _thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        thumb_height = max(1, round(height * self.THUMB_WIDTH / width))
+        thumb = cv2.resize(frame, (self.THUMB_WIDTH, thumb_height), interpolation=cv2.INTER_AREA)
+        if thumb.ndim == 3:
+            thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+        return thumb.astype(np.int16)
+
+    def prime(self, frame, scene_start):
+        """用已处理过的前一帧初始化比较参照（续传时使用）"""
+        self._prev_thumb = self._thumbnail(frame)
+        self.scene_start = scene_start
+
+    def check(self, frame_index, frame):
+        thumb = self._thumbnail(frame)
+        is_cut = self._prev_thumb is None or np.abs(thumb - self._prev_thumb).mean() > self.threshold
+        self._prev_thumb = thumb
+
+        if is_cut:
+            self.scene_start = frame_index
+            return None
+        return self.scene_start
+
+
+def _png_complete(path):
+    """检查PNG文件是否以IEND块结尾（写入中断的文件会缺少该结尾）"""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < 12:
+                return False
+            f.seek(-12, os.SEEK_END)
+            return f.read() == b'\x00\x00\x00\x00IEND\xaeB`\x82'
+    except OSError:
+        return False
+
 
 class VideoToPNG:
-    def __init__(self):
+    # 目标帧平均间隔超过该时长（秒）时改用跳转解码
+    SEEK_MIN_GAP_SECONDS = 2.0
+    # 顺序解码时遇到超过该时长（秒）的空档（如续传时已完成的区间）也直接跳转
+    SEQUENTIAL_SEEK_GAP_SECONDS = 30.0
+    # 续传时只校验最近完成的这么多个文件
+    RESUME_VERIFY_COUNT = 16
+    # 去重时记录跳过帧与保留帧对应关系的文件
+    DEDUP_MAP_FILENAME = 'dedup_map.csv'
+    # 场景模式输出的镜头列表
+    SCENE_LIST_FILENAME = 'scenes.csv'
+    # 与ImageResizer缩放算法名称对应的OpenCV插值方式（放大时使用）
+    RESIZE_INTERPOLATIONS = {
+        'LANCZOS': cv2.INTER_LANCZOS4,
+        'BICUBIC': cv2.INTER_CUBIC,
+        'BILINEAR': cv2.INTER_LINEAR,
+        'NEAREST': cv2.INTER_NEAREST,
+    }
+
+    def __init__(self, info_cache=None):
         self.supported_formats = ['.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm']
+        self.info_cache = info_cache or VideoInfoCache()
     
-    def extract_frames(self, video_path, output_dir, frame_rate=None, start_time=0, end_time=None, quality=95):
+    def extract_frames(self, video_path, output_dir, frame_rate=None, start_time=0, end_time=None, quality=95,
+                       encode_threads=None, count=None, strategy='auto', workers=1, resume=True,
+                       dedup_threshold=None, scenes=False, scene_threshold=30.0,
+                       width=None, height=None, keep_aspect_ratio=True, roi=None, resize_method='LANCZOS'):
         """
         从视频中提取帧并保存为PNG图片
         
@@ -27,38 +388,37 @@ class VideoToPNG:
             start_time (float): 开始时间（秒）
             end_time (float): 结束时间（秒），None表示到视频结尾
             quality (int): PNG压缩质量 (0-9, 0最高质量)
+            encode_threads (int): PNG编码线程数，None表示自动，1表示在解码线程中同步编码
+            count (int): 在时间范围内均匀提取的帧数，不能与frame_rate同时使用
+            strategy (str): 解码方式 ('auto', 'sequential', 'seek')，auto按采样密度自动选择
+            workers (int): 分段并行提取的进程数，1表示单进程
+            resume (bool): 参数与输出目录中的清单一致时，跳过已完成的帧
+            dedup_threshold (float): 近似重复帧阈值（32x32灰度缩略图的平均绝对差，0-255），
+                None表示不去重。多进程时每段的第一帧总会保留
+            scenes (bool): 场景模式，只保存检测到的镜头切换处的帧（按单进程顺序解码）。
+                frame_rate/count此时决定检测的采样密度
+            scene_threshold (float): 镜头切换阈值（缩小后相邻帧灰度的平均绝对差，0-255）
+            width (int): 输出宽度，与height都为None时保持原尺寸（规则同ImageResizer）
+            height (int): 输出高度
+            keep_aspect_ratio (bool): 缩放时是否保持宽高比
+            roi (tuple): 裁剪区域 (x, y, w, h)，在缩放之前应用
+            resize_method (str): 缩放算法 ('LANCZOS', 'BICUBIC', 'BILINEAR', 'NEAREST')
         """
-        # 检查视频文件是否存在
-        if not os.path.exists(video_path):
-            raise FileNotFoundError(f"视频文件不存在: {video_path}")
-        
-        # 检查文件格式
-        file_ext = Path(video_path).suffix.lower()
-        if file_ext not in self.supported_formats:
-            raise ValueError(f"不支持的视频格式: {file_ext}")
-        
         # 创建输出目录
         os.makedirs(output_dir, exist_ok=True)
         
-        # 打开视频文件
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            raise ValueError(f"无法打开视频文件: {video_path}")
-        
-        # 获取视频信息（使用改进的帧率检测）
-        video_info = self.get_video_info(video_path)
-        if not video_info:
-            raise ValueError(f"无法获取视频信息: {video_path}")
-        
-        total_frames = video_info['total_frames']
-        video_fps = video_info['fps']
-        video_duration = video_info['duration']
+        # 获取视频信息并按时间戳计算需要提取的帧
+        plan = self._plan_extraction(video_path, frame_rate, start_time, end_time, count, strategy)
+        video_info = plan['video_info']
+        targets = plan['targets']
+        video_fps = plan['fps']
+        strategy = plan['strategy']
         
         print(f"视频信息:")
         print(f"  文件: {video_path}")
-        print(f"  总帧数: {total_frames}")
+        print(f"  总帧数: {video_info['total_frames']}")
         print(f"  帧率: {video_fps:.2f} FPS")
-        print(f"  时长: {video_duration:.2f} 秒")
+        print(f"  时长: {video_info['duration']:.2f} 秒")
         
         # 显示帧率检测详情
         fps_methods = video_info.get('fps_methods', [])
@@ -70,77 +430,531 @@ class VideoToPNG:
                 status = " ✓" if abs(value - video_fps) < 0.01 else ""
                 print(f"    {method}: {value:.2f} FPS{status}")
         
-        # 计算起始和结束帧
-        start_frame = int(start_time * video_fps)
-        if end_time:
-            # 确保包含结束时间的那一帧
-            end_frame = min(int(end_time * video_fps) + 1, total_frames)
-        else:
-            end_frame = total_frames
+        if roi and (roi[2] <= 0 or roi[3] <= 0 or roi[0] >= video_info['width'] or roi[1] >= video_info['height']):
+            raise ValueError(f"裁剪区域超出画面范围: {tuple(roi)}")
         
-        # 设置起始位置
-        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        # 场景模式需要逐帧比较相邻帧，只能单进程顺序解码
+        if scenes:
+            if dedup_threshold is not None:
+                raise ValueError("scenes和dedup_threshold不能同时使用")
+            strategy = 'sequential'
+            workers = 1
         
-        # 计算帧间隔
-        if frame_rate:
-            frame_interval = max(1, int(video_fps / frame_rate))
+        # 断点续传：跳过清单中已完成且文件完好的帧，以及已判定为重复/同一镜头的帧
+        manifest_params = self._manifest_params(video_path, plan, {
+            'frame_rate': frame_rate,
+            'start_time': start_time,
+            'end_time': end_time,
+            'count': count,
+            'quality': quality,
+            'dedup_threshold': dedup_threshold,
+            'scene_threshold': scene_threshold if scenes else None,
+            'width': width,
+            'height': height,
+            'keep_aspect_ratio': keep_aspect_ratio,
+            'roi': roi,
+            'resize_method': resize_method,
+        })
+        if resume:
+            state = self._verified_state(output_dir, ExtractionManifest.merge(output_dir, manifest_params), video_fps)
         else:
-            frame_interval = 1
+            state = ExtractionManifest.empty_state()
+        ExtractionManifest.merge(output_dir, manifest_params, state)
+        done_set = set(state['completed']) | set(state['duplicates'])
+        remaining = [t for t in targets if t not in done_set] if done_set else targets
+        skipped_count = len(targets) - len(remaining)
         
-        frame_count = 0
-        saved_count = 0
+        workers = max(1, min(workers or 1, len(remaining)))
+        if encode_threads is None:
+            # 多进程时各进程平分编码线程
+            encode_threads = max(1, default_encode_threads() // workers)
         
         print(f"\n开始提取帧...")
-        print(f"  提取范围: 第{start_frame}帧 到 第{end_frame}帧")
-        print(f"  帧间隔: {frame_interval}")
+        print(f"  提取范围: 第{plan['start_frame']}帧 到 第{plan['end_frame']}帧")
+        print(f"  目标帧数: {len(targets)}")
+        if skipped_count:
+            print(f"  续传: 跳过已完成的 {skipped_count} 帧")
+        print(f"  解码方式: {'跳转解码' if strategy == 'seek' else '顺序解码'}")
+        print(f"  编码线程: {encode_threads}")
+        if roi:
+            print(f"  裁剪区域: x={roi[0]}, y={roi[1]}, {roi[2]}x{roi[3]}")
+        if width or height:
+            print(f"  输出尺寸: {width or '自动'}x{height or '自动'} ({resize_method})")
         
+        job = {
+            'video_path': video_path,
+            'output_dir': output_dir,
+            'fps': video_fps,
+            'strategy': strategy,
+            'quality': quality,
+            'encode_threads': encode_threads,
+            'manifest_params': manifest_params,
+            'dedup_threshold': dedup_threshold,
+            'scene_threshold': scene_threshold if scenes else None,
+            'width': width,
+            'height': height,
+            'keep_aspect_ratio': keep_aspect_ratio,
+            'roi': tuple(roi) if roi else None,
+            'resize_method': resize_method,
+        }
         try:
-            while True:
-                ret, frame = cap.read()
-                if not ret or cap.get(cv2.CAP_PROP_POS_FRAMES) - 1 >= end_frame:
-                    break
-                
-                current_frame = int(cap.get(cv2.CAP_PROP_POS_FRAMES)) - 1
+            if workers > 1:
+                # 多进程分段提取：每个进程独立打开视频
+                print(f"  工作进程: {workers}")
+                self._extract_segments(job, remaining, workers)
+            else:
+                self._extract_targets(job, remaining, prime=self._scene_prime(targets, remaining, state)
+                                      if scenes else None)
+        finally:
+            state = ExtractionManifest.merge(output_dir, manifest_params)
+        
+        # 以清单为准统计（包含续传前已完成的帧）
+        completed_set = set(state['completed'])
+        saved_count = sum(1 for t in targets if t in completed_set)
+        if dedup_threshold is not None:
+            duplicate_count = self._write_dedup_map(output_dir, state['duplicates'], video_fps)
+            print(f"\n\n去重: 跳过 {duplicate_count} 张重复帧，对应关系见 {self.DEDUP_MAP_FILENAME}")
+        if scenes:
+            scene_count = self._write_scene_list(output_dir, state, video_fps)
+            print(f"\n\n场景检测: 共 {scene_count} 个镜头，列表见 {self.SCENE_LIST_FILENAME}")
+        print(f"\n\n完成! 总共保存了 {saved_count} 张PNG图片到: {output_dir}")
+        return saved_count
+
+    def iter_frames(self, video_path, frame_rate=None, start_time=0, end_time=None, count=None,
+                    strategy='auto', reuse_buffer=False):
+        """
+        逐帧解码视频，不写磁盘
+
+        参数含义与extract_frames相同。reuse_buffer=True时所有帧都解码到
+        同一块预分配的内存中，下一次迭代会覆盖上一帧，需要保留时请自行copy()。
+
+        Yields:
+            tuple: (帧号, 时间戳(秒), BGR图像ndarray)
+        """
+        plan = self._plan_extraction(video_path, frame_rate, start_time, end_time, count, strategy)
+        cap = self._open_capture(video_path)
+        yield from self._iter_capture(cap, plan['targets'], plan['fps'], plan['strategy'], reuse_buffer)
+
+    def _open_capture(self, video_path):
+        """打开视频文件，失败时抛出异常"""
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"无法打开视频文件: {video_path}")
+        return cap
+
+    def _plan_extraction(self, video_path, frame_rate=None, start_time=0, end_time=None, count=None,
+                         strategy='auto'):
+        """检查输入并计算提取范围、目标帧和解码方式"""
+        # 检查视频文件是否存在
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(f"视频文件不存在: {video_path}")
+        
+        # 检查文件格式
+        file_ext = Path(video_path).suffix.lower()
+        if file_ext not in self.supported_formats:
+            raise ValueError(f"不支持的视频格式: {file_ext}")
+
+        if frame_rate and count:
+            raise ValueError("frame_rate和count不能同时指定")
+        if frame_rate is not None and frame_rate <= 0:
+            raise ValueError(f"提取帧率必须大于0: {frame_rate}")
+        if count is not None and count <= 0:
+            raise ValueError(f"提取帧数必须大于0: {count}")
+
+        video_info = self.get_video_info(video_path)
+        if not video_info:
+            raise ValueError(f"无法获取视频信息: {video_path}")
+
+        video_fps = video_info['fps']
+        start_frame, end_frame = self._frame_range(video_fps, video_info['total_frames'], start_time, end_time)
+        targets = self._select_frames(start_frame, end_frame, video_fps, start_time, frame_rate, count)
+
+        return {
+            'video_info': video_info,
+            'fps': video_fps,
+            'start_frame': start_frame,
+            'end_frame': end_frame,
+            'targets': targets,
+            'strategy': self._choose_strategy(targets, video_fps, strategy),
+        }
+
+    def _extract_targets(self, job, targets, show_progress=True, prime=None):
+        """
+        解码目标帧并保存为PNG，返回保存的图片数量
+
+        prime为(帧号, 所属镜头起始帧号)时，先解码该帧作为场景检测的参照，不保存。
+        """
+        output_dir = job['output_dir']
+        quality = job['quality']
+        encode_threads = job['encode_threads']
+        manifest = ExtractionManifest(output_dir, job['manifest_params'])
+        dedup = None
+        if job.get('scene_threshold') is not None:
+            dedup = SceneDetector(job['scene_threshold'])
+        elif job.get('dedup_threshold') is not None:
+            dedup = FrameDeduplicator(job['dedup_threshold'])
+        if prime is not None:
+            targets = [prime[0]] + list(targets)
+        saved_count = 0
+        duplicate_count = 0
+
+        # 多线程流水线：解码在当前线程，PNG编码/写盘交给线程池；
+        # 同步编码时帧在下一次解码前就已写完，可以复用同一块解码缓冲区
+        writer = None
+        if encode_threads > 1:
+            writer = FrameWriterPool(encode_threads, quality, on_saved=manifest.mark_done)
+        frames = self._iter_capture(self._open_capture(job['video_path']), targets, job['fps'],
+                                    job['strategy'], reuse_buffer=writer is None)
+
+        try:
+            for current_frame, timestamp, frame in frames:
+                # 裁剪只是取视图，放在去重之前，使去重/场景检测只看关心的区域
+                if job.get('roi'):
+                    frame = self._crop_frame(frame, job['roi'])
+
+                if prime is not None and current_frame == prime[0]:
+                    dedup.prime(frame, prime[1])
+                    continue
+
+                # 与上一张保留帧近似重复（或属于同一镜头）时只记录对应关系，不编码
+                if dedup:
+                    kept_index = dedup.check(current_frame, frame)
+                    if kept_index is not None:
+                        manifest.mark_duplicate(current_frame, kept_index)
+                        duplicate_count += 1
+                        continue
+
+                # 在解码得到的数组上直接缩放，只编码写出最终尺寸的图片
+                if job.get('width') or job.get('height'):
+                    frame = self._resize_frame(frame, job)
+
+                output_path = os.path.join(output_dir, self._frame_filename(current_frame, job['fps']))
                 
-                # 按间隔保存帧
-                if (current_frame - start_frame) % frame_interval == 0:
-                    # 生成文件名
-                    timestamp = current_frame / video_fps
-                    filename = f"frame_{current_frame:06d}_{timestamp:.3f}s.png"
-                    output_path = os.path.join(output_dir, filename)
-                    
-                    # 保存PNG文件，设置压缩级别
+                # 保存PNG文件，设置压缩级别
+                if writer:
+                    writer.submit(output_path, frame, current_frame)
+                else:
                     cv2.imwrite(output_path, frame, [cv2.IMWRITE_PNG_COMPRESSION, quality])
-                    saved_count += 1
-                    
-                    # 显示进度
-                    progress = (current_frame - start_frame) / (end_frame - start_frame) * 100
-                    print(f"\r  进度: {progress:.1f}% - 已保存 {saved_count} 张图片", end="", flush=True)
+                    manifest.mark_done(current_frame)
+                saved_count += 1
                 
-                frame_count += 1
+                # 显示进度
+                if show_progress:
+                    progress = (saved_count + duplicate_count) / max(1, len(targets) - (prime is not None)) * 100
+                    print(f"\r  进度: {progress:.1f}% - 已保存 {saved_count} 张图片", end="", flush=True)
         
         except KeyboardInterrupt:
             print(f"\n\n用户中断操作，已保存 {saved_count} 张图片")
         except Exception as e:
             print(f"\n\n错误: {str(e)}")
         finally:
-            cap.release()
-        
-        print(f"\n\n完成! 总共保存了 {saved_count} 张PNG图片到: {output_dir}")
+            frames.close()
+            if writer:
+                # 等待队列中剩余的帧写完，以实际写入数量为准
+                writer.close()
+                saved_count = writer.saved_count
+                if writer.error is not None:
+                    print(f"\n\n写入错误: {writer.error}")
+            manifest.flush()
+
         return saved_count
-    
-    def get_video_info(self, video_path):
-        """获取视频基本信息"""
+
+    def _extract_segments(self, job, targets, workers):
+        """
+        把目标帧按顺序切成workers段，由多个进程并行提取
+
+        分段只是对同一份目标帧列表的切分，帧集合和文件名与单进程完全一致。
+        """
+        segment_size = -(-len(targets) // workers)
+        segments = [targets[i:i + segment_size] for i in range(0, len(targets), segment_size)]
+
+        saved_count = 0
+        done_count = 0
+        executor = ProcessPoolExecutor(max_workers=len(segments))
+        try:
+            futures = [executor.submit(_extract_segment, job, segment) for segment in segments]
+            for future in as_completed(futures):
+                saved_count += future.result()
+                done_count += 1
+                print(f"\r  进度: {done_count}/{len(segments)} 段完成 - 已保存 {saved_count} 张图片",
+                      end="", flush=True)
+        except KeyboardInterrupt:
+            print(f"\n\n用户中断操作，已保存 {saved_count} 张图片")
+            executor.shutdown(wait=False, cancel_futures=True)
+        except Exception as e:
+            print(f"\n\n错误: {str(e)}")
+        finally:
+            executor.shutdown(wait=True)
+
+        return saved_count
+
+    def _crop_frame(self, frame, roi):
+        """按 (x, y, w, h) 裁剪，返回原数组的视图"""
+        x, y, w, h = roi
+        cropped = frame[max(0, y):y + h, max(0, x):x + w]
+        if cropped.size == 0:
+            raise ValueError(f"裁剪区域超出画面范围: {roi}")
+        return cropped
+
+    def _resize_frame(self, frame, job):
+        """按ImageResizer的尺寸规则缩放帧"""
+        orig_height, orig_width = frame.shape[:2]
+        target_width, target_height = ImageResizer()._calculate_target_size(
+            orig_width, orig_height, job.get('width'), job.get('height'), job.get('keep_aspect_ratio', True)
+        )
+        target_width, target_height = max(1, target_width), max(1, target_height)
+        if (target_width, target_height) == (orig_width, orig_height):
+            return frame
+
+        method = job.get('resize_method') or 'LANCZOS'
+        if method == 'NEAREST':
+            interpolation = cv2.INTER_NEAREST
+        elif target_width < orig_width and target_height < orig_height:
+            # 缩小时用区域插值抗锯齿，效果接近PIL的LANCZOS/BICUBIC缩小
+            interpolation = cv2.INTER_AREA
+        else:
+            interpolation = self.RESIZE_INTERPOLATIONS.get(method, cv2.INTER_LANCZOS4)
+        return cv2.resize(frame, (target_width, target_height), interpolation=interpolation)
+
+    def _frame_filename(self, frame_index, video_fps):
+        """输出文件名：frame_{帧号:06d}_{时间戳:.3f}s.png"""
+        return f"frame_{frame_index:06d}_{frame_index / video_fps:.3f}s.png"
+
+    def _manifest_params(self, video_path, plan, options):
+        """决定输出内容的参数；续传时必须与清单中的记录完全一致"""
+        stat = os.stat(video_path)
+        params = {
+            'video': os.path.abspath(video_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'fps': plan['fps'],
+        }
+        params.update(options)
+        # 统一为JSON往返后的形式，便于与清单中的记录比较
+        return json.loads(json.dumps(params))
+
+    def _verified_state(self, output_dir, state, video_fps):
+        """过滤掉文件已丢失的帧，并校验最近完成的几个文件是否完整"""
+        completed = state['completed']
+        if not completed:
+            return ExtractionManifest.empty_state()
+        existing = set(os.listdir(output_dir))
+        done = [i for i in completed if self._frame_filename(i, video_fps) in existing]
+
+        verify_from = max(0, len(done) - self.RESUME_VERIFY_COUNT)
+        broken = {
+            i for i in done[verify_from:]
+            if not _png_complete(os.path.join(output_dir, self._frame_filename(i, video_fps)))
+        }
+        done = [i for i in done if i not in broken]
+
+        # 代表帧失效时，对应的重复帧也需要重新判断
+        done_set = set(done)
+        duplicates = {k: v for k, v in state['duplicates'].items() if v in done_set}
+        return {'completed': done, 'duplicates': duplicates}
+
+    def _write_dedup_map(self, output_dir, duplicates, video_fps):
+        """写出重复帧对应表(CSV)，返回重复帧数量"""
+        with open(os.path.join(output_dir, self.DEDUP_MAP_FILENAME), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame', 'timestamp', 'represented_by'])
+            for frame_index in sorted(duplicates):
+                writer.writerow([frame_index, f"{frame_index / video_fps:.3f}",
+                                 self._frame_filename(duplicates[frame_index], video_fps)])
+        return len(duplicates)
+
+    def _scene_prime(self, targets, remaining, state):
+        """续传场景检测时，用剩余帧之前的最后一个已处理帧作为比较参照"""
+        if not remaining or not state['completed']:
+            return None
+        position = targets.index(remaining[0]) if isinstance(targets, list) else remaining[0] - targets.start
+        if position == 0:
+            return None
+        previous = targets[position - 1]
+        if previous in state['duplicates']:
+            return previous, state['duplicates'][previous]
+        if previous in set(state['completed']):
+            return previous, previous
+        return None
+
+    def _write_scene_list(self, output_dir, state, video_fps):
+        """写出镜头列表(CSV)，返回镜头数量"""
+        scene_starts = sorted(state['completed'])
+        frame_counts = {start: 1 for start in scene_starts}
+        for scene_start in state['duplicates'].values():
+            if scene_start in frame_counts:
+                frame_counts[scene_start] += 1
+
+        with open(os.path.join(output_dir, self.SCENE_LIST_FILENAME), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['scene', 'frame', 'timestamp', 'sampled_frames', 'file'])
+            for number, scene_start in enumerate(scene_starts, 1):
+                writer.writerow([number, scene_start, f"{scene_start / video_fps:.3f}",
+                                 frame_counts[scene_start], self._frame_filename(scene_start, video_fps)])
+        return len(scene_starts)
+
+    def _frame_range(self, video_fps, total_frames, start_time=0, end_time=None):
+        """计算提取范围 [start_frame, end_frame)"""
+        start_frame = int(start_time * video_fps)
+        if end_time:
+            # 确保包含结束时间的那一帧
+            end_frame = min(int(end_time * video_fps) + 1, total_frames)
+        else:
+            end_frame = total_frames
+        return start_frame, max(start_frame, end_frame)
+
+    def _select_frames(self, start_frame, end_frame, video_fps, start_time=0, frame_rate=None, count=None):
+        """
+        按时间戳选择需要提取的帧号
+
+        每个目标时间戳都由序号直接计算后取最近的帧，
+        29.97等小数帧率下不会像累加帧间隔那样产生漂移。
+
+        Returns:
+            range或list: 递增且不重复的帧号
+        """
+        if frame_rate:
+            targets = []
+            k = 0
+            while True:
+                frame_index = max(start_frame, int(round((start_time + k / frame_rate) * video_fps)))
+                if frame_index >= end_frame:
+                    break
+                targets.append(frame_index)
+                k += 1
+        elif count:
+            # 在提取范围内均匀选取count帧（包含首尾）
+            span = end_frame - 1 - start_frame
+            if end_frame <= start_frame:
+                targets = []
+            elif count == 1:
+                targets = [start_frame]
+            else:
+                targets = [start_frame + int(round(k * span / (count - 1))) for k in range(count)]
+        else:
+            return range(start_frame, end_frame)
+
+        return sorted(set(targets))
+
+    def _choose_strategy(self, targets, video_fps, strategy='auto'):
+        """根据目标帧的平均间隔在顺序解码('sequential')和跳转解码('seek')之间选择"""
+        if strategy not in ('auto', 'sequential', 'seek'):
+            raise ValueError(f"不支持的解码方式: {strategy}")
+        if strategy != 'auto':
+            return strategy
+        if len(targets) < 2:
+            return 'sequential'
+        average_gap = (targets[-1] - targets[0]) / (len(targets) - 1)
+        return 'seek' if average_gap >= self.SEEK_MIN_GAP_SECONDS * video_fps else 'sequential'
+
+    def _iter_capture(self, cap, targets, video_fps, strategy='sequential', reuse_buffer=False):
+        """
+        按目标帧号解码，依次产出 (帧号, 时间戳, 图像)，结束时释放cap
+
+        顺序解码时被跳过的帧只grab()不retrieve()，省去颜色转换；
+        跳转解码时距离下一目标较远就直接设置帧位置，
+        由后端从最近的关键帧开始向前解码到目标帧。
+        """
+        seek_seconds = self.SEEK_MIN_GAP_SECONDS if strategy == 'seek' else self.SEQUENTIAL_SEEK_GAP_SECONDS
+        seek_gap = seek_seconds * video_fps
+        buffer = None
+
+        try:
+            if not targets:
+                return
+
+            # 本地维护帧号，避免每帧调用cap.get(CAP_PROP_POS_FRAMES)
+            cap.set(cv2.CAP_PROP_POS_FRAMES, targets[0])
+            current_frame = targets[0]
+            for target in targets:
+                if target - current_frame > seek_gap:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                    current_frame = target
+
+                while current_frame < target:
+                    if not cap.grab():
+                        return
+                    current_frame += 1
+
+                if not cap.grab():
+                    return
+                ret, frame = cap.retrieve(buffer)
+                if not ret:
+                    return
+                if reuse_buffer:
+                    buffer = frame
+                current_frame += 1
+                yield target, target / video_fps, frame
+        finally:
+            cap.release()
+
+    def get_video_info(self, video_path, accurate=False, use_cache=True):
+        """
+        获取视频基本信息
+
+        默认只读取容器元数据；accurate=True或元数据不合理时才执行
+        seek/采样等耗时的帧率检测。结果按路径、文件大小和修改时间缓存到磁盘。
+
+        Args:
+            video_path (str): 视频文件路径
+            accurate (bool): 是否执行完整的帧率检测
+            use_cache (bool): 是否使用磁盘缓存
+        """
+        probe = 'full' if accurate else 'fast'
+        if use_cache:
+            info = self.info_cache.get(video_path, probe)
+            if info:
+                return info
+
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             return None
 
-        # 获取基本信息
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        fps_reported = cap.get(cv2.CAP_PROP_FPS)  # OpenCV报告的帧率
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        try:
+            # 获取基本信息
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            fps_reported = cap.get(cv2.CAP_PROP_FPS)  # OpenCV报告的帧率
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+            # 元数据明显不合理时自动升级为完整检测
+            metadata_ok = total_frames > 0 and width > 0 and height > 0 and 1.0 <= fps_reported <= 120.0
+            if accurate or not metadata_ok:
+                info = self._probe_full(cap, video_path, total_frames, fps_reported, width, height)
+            else:
+                info = self._build_info(video_path, total_frames, fps_reported, width, height,
+                                        fps_reported, total_frames / fps_reported,
+                                        [], [("OpenCV报告", fps_reported)], 'fast')
+        finally:
+            cap.release()
+
+        if use_cache:
+            self.info_cache.put(video_path, probe, info)
+        return info
+
+    def _build_info(self, video_path, total_frames, fps_reported, width, height,
+                    fps, duration, duration_methods, fps_methods, probe):
+        """组装视频信息字典"""
+        # 获取文件大小
+        file_size = os.path.getsize(video_path)
+        size_mb = file_size / (1024 * 1024)
 
+        return {
+            'filename': os.path.basename(video_path),
+            'total_frames': total_frames,
+            'fps': fps,
+            'width': width,
+            'height': height,
+            'duration': duration,
+            'size_mb': size_mb,
+            'duration_methods': duration_methods,  # 调试信息
+            'fps_methods': fps_methods,  # 帧率调试信息
+            'fps_reported': fps_reported,  # OpenCV原始报告的帧率
+            'probe': probe,  # 探测级别: fast/full
+        }
+
+    def _probe_full(self, cap, video_path, total_frames, fps_reported, width, height):
+        """通过seek和采样多种方法检测帧率和时长（较慢）"""
         # 多种方法计算帧率，选择最准确的
         fps_methods = []
         duration_methods = []
@@ -235,27 +1049,12 @@ class VideoToPNG:
         if duration <= 0 and fps > 0:
             duration = total_frames / fps
 
-        # 获取文件大小
-        file_size = os.path.getsize(video_path)
-        size_mb = file_size / (1024 * 1024)
-
-        info = {
-            'filename': os.path.basename(video_path),
-            'total_frames': total_frames,
-            'fps': fps,
-            'width': width,
-            'height': height,
-            'duration': duration,
-            'size_mb': size_mb,
-            'duration_methods': duration_methods,  # 调试信息
-            'fps_methods': fps_debug_info,  # 帧率调试信息
-            'fps_reported': fps_reported,  # OpenCV原始报告的帧率
-        }
+        return self._build_info(video_path, total_frames, fps_reported, width, height,
+                                fps, duration, duration_methods, fps_debug_info, 'full')
 
-        cap.release()
-        return info
-
-    def convert(self, video_path, output_dir, frame_rate=None, start_time=0, end_time=None, quality=3):
+    def convert(self, video_path, output_dir, frame_rate=None, start_time=0, end_time=None, quality=3,
+                encode_threads=None, count=None, workers=1, resume=True, dedup_threshold=None,
+                scenes=False, width=None, height=None, keep_aspect_ratio=True, roi=None):
         """
         转换视频为PNG图片序列（GUI专用接口）
 
@@ -266,12 +1065,25 @@ class VideoToPNG:
             start_time (int): 开始时间（秒）
             end_time (int): 结束时间（秒），0或None表示到结尾
             quality (int): PNG压缩级别 (0-9)
+            encode_threads (int): PNG编码线程数，None或0表示自动
+            count (int): 均匀提取的帧数，指定后忽略frame_rate
+            workers (int): 分段并行提取的进程数
+            resume (bool): 是否从输出目录中的清单续传
+            dedup_threshold (float): 近似重复帧阈值，None表示不去重
+            scenes (bool): 只保存镜头切换处的帧
+            width (int): 输出宽度，0或None表示不缩放
+            height (int): 输出高度，0或None表示不缩放
+            keep_aspect_ratio (bool): 是否保持宽高比
+            roi (tuple): 裁剪区域 (x, y, w, h)
 
         Returns:
             int: 保存的图片数量
         """
         # 转换参数
         end_time = None if end_time == 0 else end_time
+        encode_threads = encode_threads or None
+        if count:
+            frame_rate = None
 
         # 调用核心转换方法
         return self.extract_frames(
@@ -280,20 +1092,51 @@ class VideoToPNG:
             frame_rate=frame_rate,
             start_time=start_time,
             end_time=end_time,
-            quality=quality
+            quality=quality,
+            encode_threads=encode_threads,
+            count=count,
+            workers=workers,
+            resume=resume,
+            dedup_threshold=dedup_threshold,
+            scenes=scenes,
+            width=width or None,
+            height=height or None,
+            keep_aspect_ratio=keep_aspect_ratio,
+            roi=roi
         )
 
 
+def _extract_segment(job, targets):
+    """子进程入口：独立打开视频并提取一个分段"""
+    return VideoToPNG()._extract_targets(job, targets, show_progress=False)
+
+
 def main():
     parser = argparse.ArgumentParser(description='视频转PNG工具')
     parser.add_argument('input', help='输入视频文件路径')
     parser.add_argument('-o', '--output', default='output_frames', help='输出目录 (默认: output_frames)')
     parser.add_argument('-r', '--rate', type=float, help='提取帧率 (例如: 1.0 表示每秒1帧)')
+    parser.add_argument('-n', '--count', type=int, help='在时间范围内均匀提取N帧 (不能与--rate同时使用)')
     parser.add_argument('-s', '--start', type=float, default=0, help='开始时间(秒) (默认: 0)')
     parser.add_argument('-e', '--end', type=float, help='结束时间(秒) (默认: 视频结尾)')
     parser.add_argument('-q', '--quality', type=int, default=3, choices=range(10), 
                        help='PNG压缩级别 0-9 (0=最高质量, 默认: 3)')
+    parser.add_argument('-t', '--threads', type=int, help='PNG编码线程数 (默认: 自动, 1=单线程)')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='分段并行提取的进程数 (默认: 1)')
+    parser.add_argument('--dedup', type=float, nargs='?', const=2.0, metavar='阈值',
+                       help='跳过与上一张保留帧近似重复的帧 (缩略图平均差阈值, 默认: 2.0)')
+    parser.add_argument('--scenes', action='store_true', help='只保存镜头切换处的帧 (配合--rate可降低检测采样密度)')
+    parser.add_argument('--scene-threshold', type=float, default=30.0,
+                       help='镜头切换阈值, 相邻帧缩略图灰度平均差 (默认: 30.0)')
+    parser.add_argument('--width', type=int, help='输出宽度 (默认: 原尺寸)')
+    parser.add_argument('--height', type=int, help='输出高度 (默认: 原尺寸)')
+    parser.add_argument('--no-aspect', action='store_true', help='缩放时不保持宽高比')
+    parser.add_argument('--roi', type=int, nargs=4, metavar=('X', 'Y', 'W', 'H'), help='裁剪区域，在缩放前应用')
+    parser.add_argument('--resize-method', choices=['LANCZOS', 'BICUBIC', 'BILINEAR', 'NEAREST'],
+                       default='LANCZOS', help='缩放算法 (默认: LANCZOS)')
+    parser.add_argument('--no-resume', action='store_true', help='忽略输出目录中的续传清单，重新提取所有帧')
     parser.add_argument('--info', action='store_true', help='只显示视频信息，不进行转换')
+    parser.add_argument('--accurate', action='store_true', help='使用较慢的多方法帧率检测 (默认只读取元数据)')
     
     args = parser.parse_args()
     
@@ -302,7 +1145,7 @@ def main():
     try:
         # 如果只是查看信息
         if args.info:
-            info = converter.get_video_info(args.input)
+            info = converter.get_video_info(args.input, accurate=args.accurate)
             if info:
                 print(f"视频信息:")
                 print(f"  分辨率: {info['width']}x{info['height']}")
@@ -320,7 +1163,19 @@ def main():
             frame_rate=args.rate,
             start_time=args.start,
             end_time=args.end,
-            quality=args.quality
+            quality=args.quality,
+            encode_threads=args.threads,
+            count=args.count,
+            workers=args.workers,
+            resume=not args.no_resume,
+            dedup_threshold=args.dedup,
+            scenes=args.scenes,
+            scene_threshold=args.scene_threshold,
+            width=args.width,
+            height=args.height,
+            keep_aspect_ratio=not args.no_aspect,
+            roi=args.roi,
+            resize_method=args.resize_method
         )
         
     except Exception as e: